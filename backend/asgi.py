@@ -0,0 +1,510 @@
+"""
+Asynchronous (ASGI) serving mode for the Language Teacher API
+
+Exposes the same /api/* routes as the Flask app in main.py, but awaits Ollama
+instead of blocking a worker on it, so a single process can keep hundreds of
+conversations in flight while Ollama does the compute. Session storage and
+handlers come from services.py, as for main.py; store calls run on a thread
+pool, as the shared SQLite store may block on other workers' writes.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from services import (LANGUAGES, EVAL_BATCH_CONCURRENCY, EVAL_BATCH_MAX_SESSIONS, store_path, sessions,
+                      chat_handler, evaluator, summarizer, sse_event)
+from evaluation_jobs import EvaluationJobs, JobQueueFull, FINISHED
+from evaluator import EvaluationError, EvaluationUnavailable
+from session_locks import AsyncSessionLocks, AsyncRequestCoalescer
+import metrics
+import tracing
+
+# Requests for one session run one at a time; a message re-sent while the
+# first copy is still being answered shares that answer
+session_locks = AsyncSessionLocks()
+chat_coalescer = AsyncRequestCoalescer()
+
+# Bulk evaluations share one concurrency limit so concurrent batches cannot flood Ollama
+batch_slots = asyncio.Semaphore(EVAL_BATCH_CONCURRENCY)
+
+class RequestMetricsMiddleware:
+    """Observe each /api/* request's latency once its body has been sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith('/api/'):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_and_capture(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_capture)
+        finally:
+            # The router records the matched route, giving a bounded label set
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, route=route,
+                                            method=scope['method'], status=str(status[0]))
+
+class RequestTracingMiddleware:
+    """Run each HTTP request inside a span that ends once its body has been sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not tracing.TRACER.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        traceparent = headers.get(b'traceparent', b'').decode('latin-1') or None
+        span, token = tracing.start_span(
+            f"{scope['method']} {scope['path']}", traceparent,
+            **{'http.method': scope['method'], 'http.target': scope['path']})
+
+        async def send_and_annotate(message):
+            if message['type'] == 'http.response.start':
+                span.set_attribute('http.status_code', message['status'])
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'x-trace-id', span.trace_id.encode('latin-1'))]
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_and_annotate)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            span.name = f"{scope['method']} {route}"
+            span.set_attribute('http.route', route)
+            tracing.end_span(span, token, error)
+
+async def _json_body(request: Request) -> dict:
+    """Parse the request body as JSON, treating a missing/invalid body as empty"""
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+async def prometheus_metrics(request: Request):
+    """Expose metrics in the Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def get_languages(request: Request):
+    """Return available languages for learning"""
+    return JSONResponse(LANGUAGES)
+
+async def chat(request: Request):
+    """Handle chat messages and maintain conversation history"""
+    try:
+        data = await _json_body(request)
+        session_id = data.get('session_id')
+        message = data.get('message')
+        language = data.get('language')
+
+        if not all([session_id, message, language]):
+            return JSONResponse({"error": "Missing required fields"}, status_code=400)
+
+        turn = await chat_coalescer.run(
+            (session_id, language, message),
+            lambda: _chat_turn(session_id, message, language)
+        )
+
+        return JSONResponse({
+            "response": turn["response"],
+            "session_id": session_id,
+            "generation": turn["generation"]
+        })
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def _chat_turn(session_id: str, message: str, language: str) -> dict:
+    """Record a user message and the AI reply; see main._chat_turn"""
+    async with session_locks.hold(session_id):
+        # Initialize session if it doesn't exist
+        session = await run_in_threadpool(sessions.get_or_create, session_id, language)
+
+        await run_in_threadpool(sessions.append_message, session_id, {
+            'role': 'user',
+            'content': message
+        }, session=session)
+
+        ai_response = await chat_handler.aget_response(
+            message,
+            language,
+            session['conversation'],
+            session
+        )
+
+        await run_in_threadpool(sessions.append_message, session_id, {
+            'role': 'assistant',
+            'content': ai_response
+        }, session=session)
+
+    # Compress turns that no longer fit in the prompt, off the request path
+    summarizer.maybe_schedule(session_id, session)
+    return {"response": ai_response, "generation": session.get('last_generation')}
+
+async def chat_stream(request: Request):
+    """Stream the AI response to a chat message as Server-Sent Events"""
+    data = await _json_body(request)
+    session_id = data.get('session_id')
+    message = data.get('message')
+    language = data.get('language')
+
+    if not all([session_id, message, language]):
+        return JSONResponse({"error": "Missing required fields"}, status_code=400)
+
+    async def generate():
+        key = (session_id, language, message)
+        future, leader = chat_coalescer.join(key)
+        if not leader:
+            # Duplicate of a message already being answered: share its reply
+            turn = await asyncio.shield(future)
+            yield sse_event({
+                "done": True,
+                "response": turn["response"],
+                "session_id": session_id,
+                "generation": turn["generation"]
+            })
+            return
+
+        tokens = []
+        generation = None
+        error = None
+        try:
+            async with session_locks.hold(session_id):
+                # Initialize session if it doesn't exist
+                session = await run_in_threadpool(sessions.get_or_create, session_id, language)
+                await run_in_threadpool(sessions.append_message, session_id, {
+                    'role': 'user',
+                    'content': message
+                }, session=session)
+                try:
+                    async for token in chat_handler.astream_response(message, language,
+                                                                     session['conversation'], session):
+                        tokens.append(token)
+                        yield sse_event({"token": token})
+                finally:
+                    # Record the reply even if the client went away mid-stream
+                    await asyncio.shield(run_in_threadpool(sessions.append_message, session_id, {
+                        'role': 'assistant',
+                        'content': "".join(tokens).strip()
+                    }, session=session))
+            generation = session.get('last_generation')
+            summarizer.maybe_schedule(session_id, session)
+
+            yield sse_event({
+                "done": True,
+                "response": "".join(tokens).strip(),
+                "session_id": session_id,
+                "generation": generation
+            })
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            chat_coalescer.finish(key, future, {"response": "".join(tokens).strip(), "generation": generation},
+                                  error)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+async def evaluate(request: Request):
+    """Evaluate the conversation and return performance report"""
+    try:
+        data = await _json_body(request)
+        session_id = data.get('session_id')
+
+        evaluation = await _evaluate_session(session_id) if session_id else None
+        if evaluation is None:
+            return JSONResponse({"error": "Invalid session ID"}, status_code=400)
+
+        return JSONResponse(evaluation)
+
+    except EvaluationUnavailable as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+    except EvaluationError as e:
+        # The model answered, but not with a report we can trust
+        return JSONResponse({"error": str(e), "generation": e.generation}, status_code=502)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def _evaluate_session(session_id: str):
+    """Evaluate a session's conversation, or return None if the session is unknown"""
+    # Wait for any reply still being generated so it is part of the report
+    async with session_locks.hold(session_id):
+        session = await run_in_threadpool(sessions.get, session_id)
+        if session is None:
+            return None
+
+        evaluation = await evaluator.aevaluate_conversation(
+            session['conversation'],
+            session['language'],
+            session.setdefault('evaluation_state', {})
+        )
+        await run_in_threadpool(sessions.touch, session_id)
+        return evaluation
+
+async def evaluate_stream(request: Request):
+    """Stream the evaluation report as Server-Sent Events, one event per part as the model writes it"""
+    data = await _json_body(request)
+    session_id = data.get('session_id')
+
+    if not session_id or await run_in_threadpool(sessions.get, session_id) is None:
+        return JSONResponse({"error": "Invalid session ID"}, status_code=400)
+
+    async def generate():
+        # Wait for any reply still being generated so it is part of the report
+        async with session_locks.hold(session_id):
+            session = await run_in_threadpool(sessions.get, session_id)
+            if session is None:
+                yield sse_event({"done": True, "error": "Invalid session ID"})
+                return
+            try:
+                async for part in evaluator.astream_evaluation(session['conversation'], session['language'],
+                                                               session.setdefault('evaluation_state', {})):
+                    yield sse_event(part)
+            except EvaluationError as e:
+                yield sse_event({"done": True, "error": str(e), "generation": e.generation})
+            await run_in_threadpool(sessions.touch, session_id)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+async def evaluate_batch(request: Request):
+    """Evaluate many sessions, streaming each report as NDJSON as soon as it is ready"""
+    data = await _json_body(request)
+    session_ids = data.get('session_ids')
+
+    if not isinstance(session_ids, list) or not session_ids:
+        return JSONResponse({"error": "session_ids must be a non-empty list"}, status_code=400)
+    session_ids = list(dict.fromkeys(session_ids))
+    if len(session_ids) > EVAL_BATCH_MAX_SESSIONS:
+        return JSONResponse({"error": f"At most {EVAL_BATCH_MAX_SESSIONS} sessions per batch"}, status_code=400)
+
+    async def evaluate_one(session_id):
+        line = {"session_id": session_id}
+        try:
+            async with batch_slots:
+                evaluation = await _evaluate_session(session_id)
+            if evaluation is None:
+                line["error"] = "Invalid session ID"
+            else:
+                line["evaluation"] = evaluation
+        except Exception as e:
+            line["error"] = str(e)
+        return line
+
+    async def generate():
+        tasks = [asyncio.ensure_future(evaluate_one(session_id)) for session_id in session_ids]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += "error" in line
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+            yield json.dumps({"done": True, "evaluated": len(tasks) - failed, "failed": failed}) + "\n"
+        finally:
+            # Drop work nobody will read if the client disconnected
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
+# The running event loop, set at startup so job worker threads can evaluate on it
+_loop = None
+
+def _run_evaluation_job(session_id: str) -> dict:
+    """
+    Evaluation job body, called on a job worker thread
+
+    The evaluation runs on the event loop so it holds the same session locks
+    as the routes; an unknown session fails the job.
+    """
+    if _loop is None:
+        raise RuntimeError("The server has not started")
+    evaluation = asyncio.run_coroutine_threadsafe(_evaluate_session(session_id), _loop).result()
+    if evaluation is None:
+        raise LookupError("Invalid session ID")
+    return evaluation
+
+evaluation_jobs = EvaluationJobs(_run_evaluation_job, path=store_path)
+
+async def submit_evaluation_job(request: Request):
+    """Queue an evaluation and return its job id without waiting for the result"""
+    data = await _json_body(request)
+    session_id = data.get('session_id')
+
+    if not session_id or await run_in_threadpool(sessions.get, session_id) is None:
+        return JSONResponse({"error": "Invalid session ID"}, status_code=400)
+
+    try:
+        job = evaluation_jobs.submit(session_id)
+    except JobQueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={'Retry-After': '5'})
+    return JSONResponse(job, status_code=202)
+
+async def evaluation_job_stats(request: Request):
+    """Return evaluation queue depth, counters and queue wait times"""
+    return JSONResponse(evaluation_jobs.stats())
+
+async def get_evaluation_job(request: Request):
+    """Return an evaluation job's status, and its report once finished"""
+    job = evaluation_jobs.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job)
+
+async def evaluation_job_events(request: Request):
+    """Push an evaluation job's status changes, then its result, as Server-Sent Events"""
+    job_id = request.path_params['job_id']
+    if evaluation_jobs.get(job_id) is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def generate():
+        # Jobs run on worker threads, so check for changes rather than block the loop
+        status = None
+        idle = 0.0
+        while True:
+            job = evaluation_jobs.get(job_id)
+            if job is None:
+                return
+            if job['status'] != status:
+                status = job['status']
+                idle = 0.0
+                yield sse_event(job)
+                if status in FINISHED:
+                    return
+            elif idle >= 15:
+                # Comment line keeps proxies from closing an idle stream
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.25)
+            idle += 0.25
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+async def evaluation_cache_stats(request: Request):
+    """Return evaluation cache hit/miss counters"""
+    return JSONResponse(evaluator.cache.stats())
+
+async def ollama_status(request: Request):
+    """Return the Ollama endpoints in use with their load and health"""
+    return JSONResponse(chat_handler.async_client.stats())
+
+async def new_session(request: Request):
+    """Create a new conversation session"""
+    session_id = str(uuid.uuid4())
+    await run_in_threadpool(sessions.create, session_id)
+    return JSONResponse({"session_id": session_id})
+
+async def clear_session(request: Request):
+    """Clear conversation history for a session"""
+    session_id = request.path_params['session_id']
+    async with session_locks.hold(session_id):
+        cleared = await run_in_threadpool(sessions.clear_conversation, session_id)
+    if cleared:
+        return JSONResponse({"message": "Session cleared"})
+    return JSONResponse({"error": "Session not found"}, status_code=404)
+
+async def session_stats(request: Request):
+    """Return session store occupancy, eviction and request coalescing counters"""
+    stats = await run_in_threadpool(sessions.stats)
+    stats["locked_sessions"] = len(session_locks)
+    stats["coalesced_requests"] = chat_coalescer.coalesced
+    return JSONResponse(stats)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Let evaluation jobs reach the event loop; close pooled Ollama connections on shutdown"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    yield
+    _loop = None
+    await chat_handler.async_client.aclose()
+    if evaluator.async_client is not chat_handler.async_client:
+        await evaluator.async_client.aclose()
+
+routes = [
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+    Route('/api/languages', get_languages, methods=['GET']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/evaluate', evaluate, methods=['POST']),
+    Route('/api/evaluate/stream', evaluate_stream, methods=['POST']),
+    Route('/api/evaluate/batch', evaluate_batch, methods=['POST']),
+    Route('/api/evaluate/jobs', submit_evaluation_job, methods=['POST']),
+    Route('/api/evaluate/jobs/stats', evaluation_job_stats, methods=['GET']),
+    Route('/api/evaluate/jobs/{job_id}', get_evaluation_job, methods=['GET']),
+    Route('/api/evaluate/jobs/{job_id}/events', evaluation_job_events, methods=['GET']),
+    Route('/api/evaluate/cache', evaluation_cache_stats, methods=['GET']),
+    Route('/api/ollama/status', ollama_status, methods=['GET']),
+    Route('/api/session/new', new_session, methods=['POST']),
+    Route('/api/session/{session_id}/clear', clear_session, methods=['POST']),
+    Route('/api/sessions/stats', session_stats, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        Middleware(RequestTracingMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', '5000')))
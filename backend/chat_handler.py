@@ -1,14 +1,94 @@
-import requests
 import json
-from typing import List, Dict
+import os
+import time
+from typing import List, Dict, Iterator, AsyncIterator, Optional, Tuple
+from ollama_client import OllamaClient, AsyncOllamaClient, get_client, get_async_client
+from circuit_breaker import CircuitOpenError
+from metrics import CHAT_FALLBACKS, CHAT_TRUNCATIONS, record_ollama_result
+import tracing
+from history import message_tokens, select_history
+from generation_budget import GenerationBudgets, generation_report
+
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'es': 'Spanish', 
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'ru': 'Russian',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'zh': 'Chinese'
+}
+
+# Fallback responses in case of API error
+FALLBACK_RESPONSES = {
+    'en': "I'm sorry, I'm having trouble responding right now. Could you try again?",
+    'es': "Lo siento, tengo problemas para responder ahora. ¿Podrías intentar de nuevo?",
+    'fr': "Je suis désolé, j'ai des difficultés à répondre maintenant. Pourriez-vous réessayer?",
+    'de': "Es tut mir leid, ich habe gerade Probleme beim Antworten. Könnten Sie es nochmal versuchen?",
+    'it': "Mi dispiace, ho problemi a rispondere ora. Potresti riprovare?",
+    'pt': "Desculpe, estou tendo problemas para responder agora. Você poderia tentar novamente?",
+    'ru': "Извините, у меня проблемы с ответом сейчас. Не могли бы вы попробовать еще раз?",
+    'ja': "申し訳ありませんが、今は返答に問題があります。もう一度お試しいただけますか？",
+    'ko': "죄송합니다. 지금 응답에 문제가 있습니다. 다시 시도해 주시겠습니까?",
+    'zh': "抱歉，我现在回复有问题。您能再试一次吗？"
+}
+
+# Tokens available for the system prompt plus conversation history
+DEFAULT_PROMPT_TOKEN_BUDGET = 2048
+
+# Ollama endpoints for chat replies: the native messages API, or one flattened prompt
+CHAT_API = 'chat'
+GENERATE_API = 'generate'
+
+# Text that marks the model starting a turn of its own, per prompt format.
+# Ollama stops generating there, and replies are also cut at the first one in
+# case the model writes a variant the stop list missed.
+DEFAULT_STOP_SEQUENCES = {
+    GENERATE_API: ["\nHuman:", "\nAssistant:", "\nSystem:"],
+    CHAT_API: ["\nHuman:", "\nUser:", "\nAssistant:", "\nSystem:"]
+}
+
+# When history has to be trimmed for /api/generate, fill only this share of the
+# budget so the following turns can keep reusing Ollama's context before the next rebuild
+REBUILD_FILL = 0.75
 
 class ChatHandler:
-    def __init__(self):
-        """Initialize the chat handler with Ollama API"""
-        self.ollama_url = "http://localhost:11434/api/generate"
+    def __init__(self, client: Optional[OllamaClient] = None,
+                 async_client: Optional[AsyncOllamaClient] = None,
+                 prompt_token_budget: Optional[int] = None, api: Optional[str] = None,
+                 stop_sequences: Optional[Dict[str, List[str]]] = None,
+                 budgets: Optional[GenerationBudgets] = None):
+        """
+        Initialize the chat handler with Ollama API
+        
+        Replies come from Ollama's /api/chat, which takes the system prompt and
+        turns as separate messages and applies the model's own chat template.
+        api='generate' (or OLLAMA_CHAT_API=generate) uses /api/generate with a
+        flattened prompt instead; the handler also switches to it by itself if
+        the Ollama server is too old to have /api/chat.
+        
+        stop_sequences (or CHAT_STOP_SEQUENCES, as JSON) maps a prompt format
+        ('chat' or 'generate') to the turn markers replies stop at, replacing
+        the defaults for the formats it names.
+        
+        budgets sets how many tokens a reply may take (see GenerationBudgets);
+        how the last reply used its budget is kept in session_state['last_generation'].
+        """
+        self.client = client or get_client()
+        self.async_client = async_client or get_async_client()
         self.model = "llama3.2"  # Free Llama model
+        self.prompt_token_budget = prompt_token_budget or int(
+            os.getenv('CHAT_PROMPT_TOKEN_BUDGET', DEFAULT_PROMPT_TOKEN_BUDGET))
+        self.api = api or os.getenv('OLLAMA_CHAT_API', CHAT_API).strip().lower()
+        self.stop_sequences = dict(DEFAULT_STOP_SEQUENCES)
+        self.stop_sequences.update(stop_sequences or json.loads(os.getenv('CHAT_STOP_SEQUENCES') or '{}'))
+        self.budgets = budgets or GenerationBudgets()
         
-    def get_response(self, user_message: str, language: str, conversation_history: List[Dict]) -> str:
+    def get_response(self, user_message: str, language: str, conversation_history: List[Dict],
+                     session_state: Optional[Dict] = None) -> str:
         """
         Get AI response in the target language
         
@@ -16,28 +96,296 @@ class ChatHandler:
             user_message: The user's message
             language: Target language code (e.g., 'en', 'es', 'fr')
             conversation_history: Previous conversation messages
+            session_state: Optional mutable per-session dict; Ollama's context
+                tokens are kept here so the next turn skips prompt re-processing
             
         Returns:
             AI response in the target language
         """
         try:
-            # Create system prompt based on target language
-            language_names = {
-                'en': 'English',
-                'es': 'Spanish', 
-                'fr': 'French',
-                'de': 'German',
-                'it': 'Italian',
-                'pt': 'Portuguese',
-                'ru': 'Russian',
-                'ja': 'Japanese',
-                'ko': 'Korean',
-                'zh': 'Chinese'
-            }
+            payload = self._build_payload(language, conversation_history, False, session_state)
+            try:
+                result = self._generate(payload)
+            except Exception as e:
+                if not self._should_rebuild(e, payload, session_state):
+                    raise
+                payload = self._build_payload(language, conversation_history, False, session_state)
+                result = self._generate(payload)
             
-            language_name = language_names.get(language, 'English')
+            reply, truncated = cut_at_turn_boundary(_reply_text(result), self._stop_sequences(payload))
+            reply = reply.strip()
+            self._finish_reply(session_state, payload, result, language, conversation_history, reply, truncated)
+            return reply
             
-            system_prompt = f"""You are a helpful language learning assistant. You are having a conversation with a student who is learning {language_name}.
+        except Exception as e:
+            # Fallback response in case of API error
+            CHAT_FALLBACKS.inc(language=language)
+            return FALLBACK_RESPONSES.get(language, FALLBACK_RESPONSES['en'])
+    
+    def stream_response(self, user_message: str, language: str, conversation_history: List[Dict],
+                        session_state: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Stream the AI response in the target language token by token
+        
+        Args:
+            user_message: The user's message
+            language: Target language code (e.g., 'en', 'es', 'fr')
+            conversation_history: Previous conversation messages
+            session_state: Optional mutable per-session dict (see get_response)
+            
+        Yields:
+            Response fragments as Ollama generates them
+        """
+        tokens = []
+        try:
+            for attempt in range(2):
+                payload = self._build_payload(language, conversation_history, True, session_state)
+                boundary = TurnBoundaryFilter(self._stop_sequences(payload))
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    with tracing.span(f"ollama.{_endpoint(payload)}", kind='chat', stream=True) as span:
+                        with self.client.post(f"/api/{_endpoint(payload)}", payload,
+                                              timeout='chat', stream=True) as response:
+                            response.raise_for_status()
+                        
+                            # Ollama streams one JSON object per line
+                            for line in response.iter_lines():
+                                if not line:
+                                    continue
+                                chunk = json.loads(line)
+                                token = boundary.feed(_reply_text(chunk))
+                                if chunk.get("done"):
+                                    token += boundary.flush()
+                                if token:
+                                    if first_token is None:
+                                        first_token = time.perf_counter() - started
+                                        span.set_attribute('time_to_first_token_ms', round(first_token * 1000, 3))
+                                    tokens.append(token)
+                                    yield token
+                                if chunk.get("done") or boundary.stopped:
+                                    if chunk.get("done"):
+                                        record_ollama_result('chat', chunk, first_token)
+                                        tracing.record_ollama_timings(span, chunk)
+                                    # Leaving early closes the stream, so Ollama stops generating
+                                    self._finish_reply(session_state, payload, chunk, language, conversation_history,
+                                                       "".join(tokens).strip(), boundary.stopped)
+                                    break
+                    return
+                except Exception as e:
+                    if tokens or not self._should_rebuild(e, payload, session_state):
+                        raise
+                        
+        except Exception as e:
+            # Only fall back if nothing reached the learner yet
+            if not tokens:
+                CHAT_FALLBACKS.inc(language=language)
+                yield FALLBACK_RESPONSES.get(language, FALLBACK_RESPONSES['en'])
+    
+    async def aget_response(self, user_message: str, language: str, conversation_history: List[Dict],
+                            session_state: Optional[Dict] = None) -> str:
+        """Asynchronous variant of get_response for the ASGI app"""
+        try:
+            payload = self._build_payload(language, conversation_history, False, session_state)
+            try:
+                result = await self._agenerate(payload)
+            except Exception as e:
+                if not self._should_rebuild(e, payload, session_state):
+                    raise
+                payload = self._build_payload(language, conversation_history, False, session_state)
+                result = await self._agenerate(payload)
+            
+            reply, truncated = cut_at_turn_boundary(_reply_text(result), self._stop_sequences(payload))
+            reply = reply.strip()
+            self._finish_reply(session_state, payload, result, language, conversation_history, reply, truncated)
+            return reply
+            
+        except Exception as e:
+            CHAT_FALLBACKS.inc(language=language)
+            return FALLBACK_RESPONSES.get(language, FALLBACK_RESPONSES['en'])
+    
+    async def astream_response(self, user_message: str, language: str, conversation_history: List[Dict],
+                               session_state: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Asynchronous variant of stream_response for the ASGI app"""
+        tokens = []
+        try:
+            for attempt in range(2):
+                payload = self._build_payload(language, conversation_history, True, session_state)
+                boundary = TurnBoundaryFilter(self._stop_sequences(payload))
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    with tracing.span(f"ollama.{_endpoint(payload)}", kind='chat', stream=True) as span:
+                        async with self.async_client.stream(f"/api/{_endpoint(payload)}", payload,
+                                                            timeout='chat') as response:
+                            response.raise_for_status()
+                            
+                            async for line in response.aiter_lines():
+                                if not line:
+                                    continue
+                                chunk = json.loads(line)
+                                token = boundary.feed(_reply_text(chunk))
+                                if chunk.get("done"):
+                                    token += boundary.flush()
+                                if token:
+                                    if first_token is None:
+                                        first_token = time.perf_counter() - started
+                                        span.set_attribute('time_to_first_token_ms', round(first_token * 1000, 3))
+                                    tokens.append(token)
+                                    yield token
+                                if chunk.get("done") or boundary.stopped:
+                                    if chunk.get("done"):
+                                        record_ollama_result('chat', chunk, first_token)
+                                        tracing.record_ollama_timings(span, chunk)
+                                    # Leaving early closes the stream, so Ollama stops generating
+                                    self._finish_reply(session_state, payload, chunk, language, conversation_history,
+                                                       "".join(tokens).strip(), boundary.stopped)
+                                    break
+                    return
+                except Exception as e:
+                    if tokens or not self._should_rebuild(e, payload, session_state):
+                        raise
+                        
+        except Exception as e:
+            if not tokens:
+                CHAT_FALLBACKS.inc(language=language)
+                yield FALLBACK_RESPONSES.get(language, FALLBACK_RESPONSES['en'])
+    
+    def _generate(self, payload: Dict) -> Dict:
+        """Call Ollama's chat (or generate) API and return the decoded result"""
+        with tracing.span(f"ollama.{_endpoint(payload)}", kind='chat') as span:
+            response = self.client.post(f"/api/{_endpoint(payload)}", payload, timeout='chat')
+            response.raise_for_status()
+            result = response.json()
+            tracing.record_ollama_timings(span, result)
+        record_ollama_result('chat', result)
+        return result
+    
+    async def _agenerate(self, payload: Dict) -> Dict:
+        """Asynchronous variant of _generate"""
+        with tracing.span(f"ollama.{_endpoint(payload)}", kind='chat') as span:
+            response = await self.async_client.post(f"/api/{_endpoint(payload)}", payload, timeout='chat')
+            response.raise_for_status()
+            result = response.json()
+            tracing.record_ollama_timings(span, result)
+        record_ollama_result('chat', result)
+        return result
+    
+    def _stop_sequences(self, payload: Dict) -> List[str]:
+        """Turn markers for the prompt format a payload uses"""
+        return self.stop_sequences.get(_endpoint(payload), [])
+    
+    def _options(self, api: str, conversation_history: List[Dict]) -> Dict:
+        """Generation options for a chat reply in the given prompt format"""
+        return {
+            "temperature": 0.7,
+            "num_predict": self.budgets.for_chat(conversation_history),
+            "stop": list(self.stop_sequences.get(api, []))
+        }
+    
+    def _finish_reply(self, session_state: Optional[Dict], payload: Dict, result: Dict, language: str,
+                      conversation_history: List[Dict], reply: str, truncated: bool):
+        """Keep Ollama's context for the next turn, unless the reply was cut at a turn boundary"""
+        if session_state is not None:
+            session_state['last_generation'] = dict(generation_report(payload['options']['num_predict'], result),
+                                                    truncated=truncated)
+        if truncated:
+            # The context would include the extra turn the learner never saw
+            CHAT_TRUNCATIONS.inc()
+            self._forget_context(session_state)
+        else:
+            self._remember_context(session_state, payload, result, language, conversation_history, reply)
+    
+    def _should_rebuild(self, error: Exception, payload: Dict, session_state: Optional[Dict]) -> bool:
+        """
+        Decide whether a failed call is worth one more try with a rebuilt payload
+        
+        That is the case when Ollama has no /api/chat (the handler then uses
+        /api/generate from now on) or when stored context tokens were rejected.
+        """
+        if isinstance(error, CircuitOpenError):
+            return False
+        if 'messages' in payload and _endpoint_missing(error):
+            self.api = GENERATE_API
+            return True
+        if 'context' in payload:
+            self._forget_context(session_state)
+            return True
+        return False
+    
+    def _reusable_context(self, language: str, conversation_history: List[Dict],
+                          session_state: Optional[Dict]) -> Optional[List[int]]:
+        """
+        Return the stored Ollama context tokens if they still describe the conversation
+        
+        The context is only valid when the conversation has grown by exactly the
+        new user message since it was produced, with the same model and language,
+        and while it plus the new turn still fits in the prompt token budget.
+        Anything else (model change, cleared session, trimmed history) drops it.
+        """
+        if session_state is None or not session_state.get('ollama_context'):
+            return None
+        
+        saved = session_state['ollama_context']
+        previous = conversation_history[:-1]
+        if (saved.get('model') != self.model
+                or saved.get('language') != language
+                or saved.get('message_count') != len(previous)
+                or not conversation_history or conversation_history[-1]['role'] != 'user'
+                or not previous or previous[-1].get('content') != saved.get('last_reply')
+                or len(saved['tokens']) + message_tokens(conversation_history[-1]) > self.prompt_token_budget):
+            self._forget_context(session_state)
+            return None
+        
+        return saved['tokens']
+    
+    def _remember_context(self, session_state: Optional[Dict], payload: Dict, result: Dict,
+                          language: str, conversation_history: List[Dict], reply: str):
+        """Store the context tokens Ollama returned so the next turn can continue from them"""
+        if session_state is None:
+            return
+        if not result.get("context") or not reply:
+            self._forget_context(session_state)
+            return
+        
+        session_state['ollama_context'] = {
+            'tokens': result["context"],
+            'model': self.model,
+            'language': language,
+            'message_count': len(conversation_history) + 1,  # including this reply
+            'last_reply': reply
+        }
+    
+    def _forget_context(self, session_state: Optional[Dict]):
+        """Drop stored context tokens so the next turn rebuilds the full prompt"""
+        if session_state is not None:
+            session_state.pop('ollama_context', None)
+    
+    @tracing.traced('chat.build_prompt')
+    def _build_payload(self, language: str, conversation_history: List[Dict], stream: bool,
+                       session_state: Optional[Dict] = None) -> Dict:
+        """Build the Ollama chat (or generate) payload for the current conversation"""
+        if session_state is not None:
+            # Set again once this reply is finished; a fallback reply has none
+            session_state.pop('last_generation', None)
+        context = None
+        if self.api == GENERATE_API:
+            # Only /api/generate returns context tokens; /api/chat reuses the
+            # cached prompt prefix on the server by itself
+            context = self._reusable_context(language, conversation_history, session_state)
+        if context is not None:
+            # Ollama already holds the system prompt and earlier turns; send only the new turn
+            return {
+                "model": self.model,
+                "prompt": self._format_prompt_for_ollama(conversation_history[-1:]),
+                "context": context,
+                "stream": stream,
+                "options": self._options(GENERATE_API, conversation_history)
+            }
+        
+        language_name = LANGUAGE_NAMES.get(language, 'English')
+        
+        system_prompt = f"""You are a helpful language learning assistant. You are having a conversation with a student who is learning {language_name}.
 
 IMPORTANT RULES:
 1. You MUST respond ONLY in {language_name}. Never use any other language.
@@ -49,49 +397,65 @@ IMPORTANT RULES:
 
 Start the conversation by greeting the student in {language_name} and asking them about their day or interests."""
 
-            # Prepare messages for OpenAI API
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add conversation history (limit to last 10 exchanges to avoid token limits)
-            recent_history = conversation_history[-20:]  # Last 10 exchanges (20 messages)
-            messages.extend(recent_history)
-            
-            # Prepare prompt for Ollama
-            prompt = self._format_prompt_for_ollama(messages)
-            
-            # Make API call to Ollama
-            payload = {
+        # Add as much recent history as fits in the token budget
+        system_prompt, recent_history = self._fit_history(system_prompt, conversation_history, session_state)
+        
+        # Prepare messages for the chat API
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend({"role": message["role"], "content": message["content"]} for message in recent_history)
+        
+        if self.api != GENERATE_API:
+            return {
                 "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "max_tokens": 200
-                }
-            }
-            
-            response = requests.post(self.ollama_url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result.get("response", "").strip()
-            
-        except Exception as e:
-            # Fallback response in case of API error
-            fallback_responses = {
-                'en': "I'm sorry, I'm having trouble responding right now. Could you try again?",
-                'es': "Lo siento, tengo problemas para responder ahora. ¿Podrías intentar de nuevo?",
-                'fr': "Je suis désolé, j'ai des difficultés à répondre maintenant. Pourriez-vous réessayer?",
-                'de': "Es tut mir leid, ich habe gerade Probleme beim Antworten. Könnten Sie es nochmal versuchen?",
-                'it': "Mi dispiace, ho problemi a rispondere ora. Potresti riprovare?",
-                'pt': "Desculpe, estou tendo problemas para responder agora. Você poderia tentar novamente?",
-                'ru': "Извините, у меня проблемы с ответом сейчас. Не могли бы вы попробовать еще раз?",
-                'ja': "申し訳ありませんが、今は返答に問題があります。もう一度お試しいただけますか？",
-                'ko': "죄송합니다. 지금 응답에 문제가 있습니다. 다시 시도해 주시겠습니까?",
-                'zh': "抱歉，我现在回复有问题。您能再试一次吗？"
+                "messages": messages,
+                "stream": stream,
+                "options": self._options(CHAT_API, conversation_history)
             }
-            return fallback_responses.get(language, fallback_responses['en'])
+        
+        # Prepare prompt for Ollama
+        prompt = self._format_prompt_for_ollama(messages)
+        
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": self._options(GENERATE_API, conversation_history)
+        }
     
+    def _fit_history(self, system_prompt: str, conversation_history: List[Dict],
+                     session_state: Optional[Dict]) -> Tuple[str, List[Dict]]:
+        """
+        Choose the history messages sent alongside the system prompt
+        
+        When the history does not fit in the budget, the oldest messages are
+        dropped and the session's running summary (see ConversationSummarizer)
+        is added to the system prompt in their place. The number of dropped
+        messages is recorded on the session so the summarizer knows what to fold in.
+        
+        Returns:
+            The (possibly extended) system prompt and the selected history
+        """
+        available = self.prompt_token_budget - message_tokens({"content": system_prompt})
+        
+        if sum(message_tokens(m) for m in conversation_history) <= available:
+            recent_history = conversation_history
+        else:
+            summary = session_state.get('summary') if session_state is not None else None
+            if summary:
+                summary_block = f"Summary of the earlier conversation:\n{summary}"
+                system_prompt = f"{system_prompt}\n\n{summary_block}"
+                available -= message_tokens({"content": summary_block})
+            if session_state is not None and self.api == GENERATE_API:
+                # Leave headroom so follow-up turns can continue from Ollama's context
+                # (only /api/generate hands context tokens back)
+                available = int(available * REBUILD_FILL)
+            recent_history = select_history(conversation_history, available)
+        
+        if session_state is not None:
+            session_state['history_dropped'] = len(conversation_history) - len(recent_history)
+        return system_prompt, recent_history
+    
+    @tracing.traced('chat.format_prompt')
     def _format_prompt_for_ollama(self, messages: List[Dict]) -> str:
         """Format messages for Ollama API"""
         prompt_parts = []
@@ -106,3 +470,68 @@ Start the conversation by greeting the student in {language_name} and asking the
         
         prompt_parts.append("Assistant:")
         return "\n\n".join(prompt_parts)
+
+def _endpoint(payload: Dict) -> str:
+    """Ollama endpoint a payload is meant for ('chat' or 'generate')"""
+    return CHAT_API if 'messages' in payload else GENERATE_API
+
+def _reply_text(result: Dict) -> str:
+    """Text of a chat or generate response (or streamed chunk)"""
+    if 'message' in result:
+        return (result.get('message') or {}).get('content', '')
+    return result.get('response', '')
+
+def _endpoint_missing(error: Exception) -> bool:
+    """True if Ollama answered 404 for the endpoint itself rather than for the model"""
+    response = getattr(error, 'response', None)
+    if response is None or response.status_code != 404:
+        return False
+    try:
+        body = response.text
+    except Exception:
+        # Unread streamed body
+        body = ''
+    return 'model' not in body.lower()
+
+def cut_at_turn_boundary(text: str, markers: List[str]) -> Tuple[str, bool]:
+    """
+    Cut a reply where the model starts another turn
+    
+    Returns:
+        The text before the first marker, and whether anything was cut
+    """
+    positions = [index for index in (text.find(marker) for marker in markers) if index >= 0]
+    if not positions:
+        return text, False
+    return text[:min(positions)], True
+
+class TurnBoundaryFilter:
+    """
+    cut_at_turn_boundary for a reply arriving in fragments
+    
+    Text that could be the start of a marker split across fragments is held
+    back until the next fragment shows whether it is one.
+    """
+    
+    def __init__(self, markers: List[str]):
+        self.markers = [marker for marker in markers if marker]
+        self.stopped = False
+        self._pending = ""
+    
+    def feed(self, fragment: str) -> str:
+        """Add a fragment and return the text that is now safe to show"""
+        if self.stopped:
+            return ""
+        text, self.stopped = cut_at_turn_boundary(self._pending + fragment, self.markers)
+        if self.stopped:
+            self._pending = ""
+            return text
+        held = max((length for marker in self.markers for length in range(1, len(marker))
+                    if text.endswith(marker[:length])), default=0)
+        self._pending = text[len(text) - held:] if held else ""
+        return text[:len(text) - held]
+    
+    def flush(self) -> str:
+        """Return the held-back text once the reply is complete"""
+        text, self._pending = self._pending, ""
+        return "" if self.stopped else text
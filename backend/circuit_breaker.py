@@ -0,0 +1,123 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a server whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to one Ollama server
+
+    Outcomes of recent calls are kept in a rolling window. Once enough calls
+    have been seen and the share of failures reaches the threshold the circuit
+    opens: calls fail immediately with CircuitOpenError instead of waiting for
+    a timeout. After a cool-down one probe call is let through (half-open); if
+    it succeeds the circuit closes again, otherwise it stays open for another
+    cool-down.
+    """
+
+    def __init__(self, failure_rate: Optional[float] = None, min_calls: Optional[int] = None,
+                 window: Optional[int] = None, reset_timeout: Optional[float] = None):
+        """
+        Initialize the breaker
+
+        Args:
+            failure_rate: Share of failed calls that opens the circuit
+                (default: OLLAMA_BREAKER_FAILURE_RATE or 0.5)
+            min_calls: Calls needed in the window before it can open
+                (default: OLLAMA_BREAKER_MIN_CALLS or 5)
+            window: Number of recent calls considered (default: OLLAMA_BREAKER_WINDOW or 20)
+            reset_timeout: Seconds to stay open before probing again
+                (default: OLLAMA_BREAKER_RESET or 15)
+        """
+        self.failure_rate = failure_rate or float(os.getenv('OLLAMA_BREAKER_FAILURE_RATE', '0.5'))
+        self.min_calls = min_calls or int(os.getenv('OLLAMA_BREAKER_MIN_CALLS', '5'))
+        self.window = window or int(os.getenv('OLLAMA_BREAKER_WINDOW', '20'))
+        self.reset_timeout = reset_timeout or float(os.getenv('OLLAMA_BREAKER_RESET', '15'))
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=self.window)  # True for success
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.trips = 0
+
+    def available(self) -> bool:
+        """Return True if a call would currently be let through"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return not self._probing
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpenError if the circuit is open"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+                self.rejected += 1
+                raise CircuitOpenError("Ollama is unavailable (circuit open)")
+            if self.state == HALF_OPEN:
+                self._probing = True
+
+    def record_success(self):
+        """Record a successful call"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._probing = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        """Record a failed call, opening the circuit if failures pass the threshold"""
+        with self._lock:
+            self._outcomes.append(False)
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            failures = self._outcomes.count(False)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def abandon(self):
+        """Forget an admitted call that ended without an outcome (e.g. was cancelled)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def stats(self) -> Dict:
+        """Return the breaker state and counters"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_failures": self._outcomes.count(False),
+                "recent_calls": len(self._outcomes),
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
+
+    def _open(self):
+        """Open the circuit (lock held)"""
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.trips += 1
+
+def backoff_delay(attempt: int, base: float, cap: float = 2.0) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
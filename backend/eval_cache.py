@@ -0,0 +1,88 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+class EvaluationCache:
+    """
+    Content-addressed cache of evaluation reports
+
+    Entries are keyed by a hash of everything that determines the model's
+    answer (model, language, user messages and prompt version), so the same
+    conversation is only evaluated once no matter which client asks. The cache
+    is bounded by entry count (least recently used entries are evicted first)
+    and entries expire after a TTL.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum cached reports (default: EVAL_CACHE_SIZE or 256)
+            ttl: Seconds a report stays valid (default: EVAL_CACHE_TTL or 3600)
+        """
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('EVAL_CACHE_SIZE', '256'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('EVAL_CACHE_TTL', '3600'))
+        self._entries = OrderedDict()  # key -> (expires_at, report)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(model: str, language: str, user_messages: List[str], prompt_version: int) -> str:
+        """Hash the inputs of an evaluation into a cache key"""
+        material = json.dumps([model, language, prompt_version, user_messages], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached report for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, key: str, report: Dict):
+        """Store a report, evicting the least recently used entries if full"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(report))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached reports"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
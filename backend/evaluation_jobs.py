@@ -0,0 +1,283 @@
+import contextvars
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+import tracing
+
+# Job states; a job moves queued -> running -> done or failed
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluation_jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    finished_at REAL,
+    job TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluation_jobs_by_finished_at ON evaluation_jobs (finished_at);
+"""
+
+# Seconds between checks on a job run by another process
+SHARED_POLL_INTERVAL = 0.25
+
+class JobQueueFull(Exception):
+    """Raised when an evaluation is submitted while the queue is at capacity"""
+
+class EvaluationJobs:
+    """
+    Background evaluation jobs run by a bounded pool of worker threads
+
+    submit() returns a job immediately instead of holding the HTTP request
+    open for the whole evaluation. Clients then poll get() or block in wait()
+    for the next state change (used for the SSE subscription). The number of
+    queued jobs is capped so a burst cannot build an unbounded backlog, and
+    the time each job spent waiting for a worker is recorded and summarised
+    in stats(). Finished jobs are kept for a while so late pollers still find
+    them.
+
+    Jobs run in the process that accepted them. With a shared database path,
+    every job's state and result is also written to it, so get() and wait()
+    find jobs submitted to any worker process on the host; stats() still
+    covers this process's pool only.
+    """
+
+    def __init__(self, run: Callable[[str], Dict], workers: Optional[int] = None,
+                 max_queued: Optional[int] = None, result_ttl: Optional[float] = None,
+                 path: Optional[str] = None):
+        """
+        Initialize the pool
+
+        Args:
+            run: Function evaluating a session id and returning the report
+            workers: Concurrent evaluations (default: EVAL_JOB_WORKERS or 2)
+            max_queued: Jobs allowed to wait for a worker (default: EVAL_JOB_QUEUE_MAX or 100)
+            result_ttl: Seconds finished jobs are kept (default: EVAL_JOB_TTL or 600)
+            path: SQLite database shared with the other worker processes, if any
+        """
+        self._run = run
+        self.workers = workers or int(os.getenv('EVAL_JOB_WORKERS', '2'))
+        self.max_queued = max_queued or int(os.getenv('EVAL_JOB_QUEUE_MAX', '100'))
+        self.result_ttl = result_ttl or float(os.getenv('EVAL_JOB_TTL', '600'))
+        self.path = path
+
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # job_id -> job dict, oldest first
+        self._contexts = {}  # job_id -> submitter's context, so traces span the queue
+        self._changed = threading.Condition()
+        self._queue_waits = deque(maxlen=500)  # recent seconds spent queued
+        self._owner = uuid.uuid4().hex  # this pool's jobs in the shared table
+        self._local = threading.local()
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+        if self.path:
+            with self._connection() as conn:
+                conn.executescript(SCHEMA)
+
+        for index in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f'evaluation-worker-{index}', daemon=True)
+            worker.start()
+
+    def submit(self, session_id: str) -> Dict:
+        """Queue an evaluation of a session and return the new job"""
+        with self._changed:
+            self._prune()
+            if self._count(QUEUED) >= self.max_queued:
+                self.rejected += 1
+                raise JobQueueFull(f"Evaluation queue is full ({self.max_queued} jobs waiting)")
+            job = {
+                'job_id': str(uuid.uuid4()),
+                'session_id': session_id,
+                'status': QUEUED,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._jobs[job['job_id']] = job
+            self._contexts[job['job_id']] = contextvars.copy_context()
+            self.submitted += 1
+            self._publish(job)
+            snapshot = self._snapshot(job)
+        self._queue.put(job['job_id'])
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the current state of a job, or None if unknown or expired"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None or not self.path:
+                return self._snapshot(job) if job else None
+        return self._load(job_id)
+
+    def wait(self, job_id: str, seen_status: Optional[str], timeout: float) -> Optional[Dict]:
+        """
+        Block until a job's status differs from seen_status or the timeout passes
+
+        Returns:
+            The job's current state, or None if the job is unknown
+        """
+        with self._changed:
+            if job_id in self._jobs or not self.path:
+                self._changed.wait_for(
+                    lambda: job_id not in self._jobs or self._jobs[job_id]['status'] != seen_status,
+                    timeout
+                )
+                job = self._jobs.get(job_id)
+                return self._snapshot(job) if job else None
+
+        # Run by another process: watch the shared table
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._load(job_id)
+            if job is None or job['status'] != seen_status or time.monotonic() >= deadline:
+                return job
+            time.sleep(SHARED_POLL_INTERVAL)
+
+    def stats(self) -> Dict:
+        """Return queue depth, throughput counters and recent queue wait times"""
+        with self._changed:
+            waits = sorted(self._queue_waits)
+            return {
+                "workers": self.workers,
+                "queued": self._count(QUEUED),
+                "running": self._count(RUNNING),
+                "max_queued": self.max_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "queue_wait_seconds": {
+                    "mean": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(waits[-1], 3) if waits else 0.0
+                }
+            }
+
+    def _work(self):
+        """Worker loop: run queued jobs one at a time"""
+        while True:
+            job_id = self._queue.get()
+            with self._changed:
+                job = self._jobs.get(job_id)
+                context = self._contexts.pop(job_id, None) or contextvars.copy_context()
+                if job is None:
+                    continue
+                job['status'] = RUNNING
+                job['started_at'] = time.time()
+                self._queue_waits.append(job['started_at'] - job['submitted_at'])
+                self._publish(job)
+                self._changed.notify_all()
+
+            try:
+                result, error = context.run(self._traced_run, job), None
+            except Exception as e:
+                result, error = None, str(e)
+
+            with self._changed:
+                job['finished_at'] = time.time()
+                job['result'] = result
+                job['error'] = error
+                job['status'] = FAILED if error else DONE
+                if error:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self._publish(job)
+                self._changed.notify_all()
+
+    def _traced_run(self, job: Dict) -> Dict:
+        """Run a job inside a span that continues the trace of the request that queued it"""
+        queue_wait = round(job['started_at'] - job['submitted_at'], 3)
+        with tracing.span('evaluation.job', job_id=job['job_id'], queue_wait_seconds=queue_wait):
+            return self._run(job['session_id'])
+
+    def _snapshot(self, job: Dict, ahead: Optional[int] = None) -> Dict:
+        """
+        Copy a job for callers, adding timing and queue position (lock held)
+
+        ahead is the number of jobs queued before it, counted here if not given.
+        """
+        now = time.time()
+        snapshot = dict(job)
+        started = job['started_at'] or now
+        snapshot['queue_wait_seconds'] = round(started - job['submitted_at'], 3)
+        if job['started_at']:
+            snapshot['run_seconds'] = round((job['finished_at'] or now) - job['started_at'], 3)
+        if job['status'] == QUEUED:
+            if ahead is None:
+                ahead = 0
+                for other in self._jobs.values():
+                    if other is job:
+                        break
+                    if other['status'] == QUEUED:
+                        ahead += 1
+            snapshot['queue_position'] = ahead + 1
+        return snapshot
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job['status'] == status)
+
+    def _prune(self):
+        """Forget finished jobs older than the result TTL (lock held)"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['status'] in FINISHED and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.path:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM evaluation_jobs WHERE finished_at < ?", (cutoff,))
+
+    def _publish(self, job: Dict):
+        """Write a job's current state to the shared table, if there is one (lock held)"""
+        if not self.path:
+            return
+        with self._connection() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO evaluation_jobs (job_id, owner, status, submitted_at, finished_at, job)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (job['job_id'], self._owner, job['status'], job['submitted_at'], job['finished_at'],
+                  json.dumps(job, ensure_ascii=False)))
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        """Read a job another process runs from the shared table, or None if unknown or expired"""
+        conn = self._connection()
+        row = conn.execute("SELECT owner, job FROM evaluation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[1])
+        if job['status'] in FINISHED and job['finished_at'] < time.time() - self.result_ttl:
+            return None
+        ahead = None
+        if job['status'] == QUEUED:
+            ahead = conn.execute("""
+                SELECT COUNT(*) FROM evaluation_jobs WHERE owner = ? AND status = ? AND submitted_at < ?
+            """, (row[0], QUEUED, job['submitted_at'])).fetchone()[0]
+        return self._snapshot(job, ahead)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection to the shared table"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,103 @@
+from typing import Dict, List
+
+MISTAKE_TYPES = ["grammar", "vocabulary", "pronunciation", "style"]
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# Shape of an evaluation report. Sent to Ollama as the "format" of the
+# evaluation call, which constrains generation to it, and used to validate
+# the result. Properties are in the order the model writes them: the score
+# comes after the analysis it is based on.
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mistakes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "message": {"type": "string"},
+                    "correction": {"type": "string"},
+                    "explanation": {"type": "string"},
+                    "type": {"type": "string", "enum": MISTAKE_TYPES}
+                },
+                "required": ["message", "correction"]
+            }
+        },
+        "strengths": _STRING_LIST,
+        "suggestions": _STRING_LIST,
+        "overall_score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "areas_for_improvement": _STRING_LIST,
+        "summary": {"type": "string"}
+    },
+    "required": ["mistakes", "strengths", "suggestions", "overall_score", "areas_for_improvement", "summary"]
+}
+
+_INVALID = object()
+
+def conform(value, schema: Dict, path: str, problems: List[str]):
+    """
+    Check a value against a (subset of) JSON Schema, repairing what can be repaired
+
+    Supports type, properties, required, items, enum, minimum and maximum,
+    which is all EVALUATION_SCHEMA uses. Invalid array items and invalid
+    optional object properties are dropped, and whole-number floats are
+    accepted as integers; everything else that does not match makes the
+    value invalid. Each problem is appended to problems as "path: reason".
+
+    Returns:
+        The conforming value, or None if it is invalid
+    """
+    result = _conform(value, schema, path, problems)
+    return None if result is _INVALID else result
+
+def _conform(value, schema: Dict, path: str, problems: List[str]):
+    expected = schema.get("type")
+
+    if expected == "object":
+        if not isinstance(value, dict):
+            problems.append(f"{path}: expected an object")
+            return _INVALID
+        conformed = {}
+        for key, property_schema in schema.get("properties", {}).items():
+            if key not in value:
+                continue
+            item = _conform(value[key], property_schema, f"{path}.{key}", problems)
+            if item is not _INVALID:
+                conformed[key] = item
+        missing = [key for key in schema.get("required", []) if key not in conformed]
+        if missing:
+            problems.append(f"{path}: missing {', '.join(missing)}")
+            return _INVALID
+        return conformed
+
+    if expected == "array":
+        if not isinstance(value, list):
+            problems.append(f"{path}: expected an array")
+            return _INVALID
+        items = (_conform(item, schema.get("items", {}), f"{path}[{index}]", problems)
+                 for index, item in enumerate(value))
+        return [item for item in items if item is not _INVALID]
+
+    if expected == "string" and not isinstance(value, str):
+        problems.append(f"{path}: expected a string")
+        return _INVALID
+
+    if expected in ("integer", "number"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            problems.append(f"{path}: expected a number")
+            return _INVALID
+        if expected == "integer":
+            if isinstance(value, float) and not value.is_integer():
+                problems.append(f"{path}: expected a whole number")
+                return _INVALID
+            value = int(value)
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            problems.append(f"{path}: {value} out of range")
+            return _INVALID
+
+    if "enum" in schema and value not in schema["enum"]:
+        problems.append(f"{path}: {value!r} is not one of {', '.join(map(str, schema['enum']))}")
+        return _INVALID
+
+    return value
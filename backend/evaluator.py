@@ -1,62 +1,443 @@
-import requests
+import copy
+import hashlib
 import json
-from typing import List, Dict
+import time
+from typing import List, Dict, Iterator, AsyncIterator, Optional, Tuple
+from ollama_client import OllamaClient, AsyncOllamaClient, get_client, get_async_client
+from eval_cache import EvaluationCache
+from generation_budget import GenerationBudgets, generation_report
+from evaluation_schema import EVALUATION_SCHEMA, conform
+from json_stream import IncrementalJSONParser
+from metrics import EVALUATION_PARSE_FAILURES, EVALUATION_PARTIAL_REPORTS, record_ollama_result
+import tracing
+
+# Bump whenever the evaluation prompt changes so cached reports are not reused
+PROMPT_VERSION = 2
+
+NO_MESSAGES_EVALUATION = {
+    "overall_score": 0,
+    "mistakes": [],
+    "suggestions": ["No user messages found to evaluate"],
+    "summary": "No conversation to evaluate"
+}
+
+# Longest strengths/suggestions/areas lists kept when merging incremental reports
+MAX_MERGED_ITEMS = 8
+
+class EvaluationError(Exception):
+    """The model's output did not contain a usable evaluation report"""
+
+    def __init__(self, message: str, generation: Optional[Dict] = None):
+        super().__init__(message)
+        self.generation = generation
+
+class EvaluationUnavailable(EvaluationError):
+    """The model could not be asked for an evaluation (Ollama down, failing or timing out)"""
+
+def _digest(messages: List[str]) -> str:
+    """Fingerprint a list of messages so a stored evaluation can be matched to them"""
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _merge_items(previous: List, latest: List) -> List:
+    """Union two lists of strings, newest first, without duplicates"""
+    merged = []
+    seen = set()
+    for item in list(latest) + list(previous):
+        key = str(item).strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(item)
+    return merged[:MAX_MERGED_ITEMS]
+
+def _report_parts(report: Dict) -> List[Dict]:
+    """The parts stream_evaluation yields for a report that is already complete"""
+    parts = [{"field": "mistakes", "item": mistake} for mistake in report.get("mistakes", [])]
+    parts.extend({"field": field, "value": report[field]}
+                 for field in EVALUATION_SCHEMA["properties"] if field in report)
+    return parts
+
+def add_evaluation_part(report: Dict, part: Dict) -> Dict:
+    """
+    Add a part yielded by stream_evaluation to a report being assembled
+
+    Returns a new dict (earlier versions are left as they were, so they can
+    be handed to another thread for display) holding the fields seen so far.
+    """
+    report = dict(report)
+    if "item" in part:
+        report[part["field"]] = report.get(part["field"], []) + [part["item"]]
+    elif "field" in part:
+        report[part["field"]] = part["value"]
+    return report
 
 class LanguageEvaluator:
-    def __init__(self):
+    def __init__(self, client: Optional[OllamaClient] = None,
+                 async_client: Optional[AsyncOllamaClient] = None,
+                 cache: Optional[EvaluationCache] = None,
+                 budgets: Optional[GenerationBudgets] = None):
         """Initialize the language evaluator with Ollama API"""
-        self.ollama_url = "http://localhost:11434/api/generate"
+        self.client = client or get_client()
+        self.async_client = async_client or get_async_client()
+        self.cache = cache if cache is not None else EvaluationCache()
+        self.budgets = budgets or GenerationBudgets()
         self.model = "llama3.2"  # Free Llama model
         
-    def evaluate_conversation(self, conversation: List[Dict], language: str) -> Dict:
+    def evaluate_conversation(self, conversation: List[Dict], language: str,
+                              state: Optional[Dict] = None) -> Dict:
         """
         Evaluate a conversation and return detailed performance report
         
         Args:
             conversation: List of conversation messages
             language: Target language code
+            state: Per-session evaluation state (a dict owned by the caller). When
+                given, only user messages that were not analysed before are sent
+                to the model and the result is merged into the stored report.
             
         Returns:
             Dictionary containing evaluation results
+        
+        Raises:
+            EvaluationUnavailable: Ollama could not be reached or failed
+            EvaluationError: The output holds no usable report
         """
         try:
-            # Extract only user messages for evaluation
-            user_messages = [msg['content'] for msg in conversation if msg['role'] == 'user']
+            report, payload, user_messages, cache_key = self._plan(conversation, language, state)
+            if report is not None:
+                return report
             
-            if not user_messages:
-                return {
-                    "overall_score": 0,
-                    "mistakes": [],
-                    "suggestions": ["No user messages found to evaluate"],
-                    "summary": "No conversation to evaluate"
-                }
+            with tracing.span('ollama.generate', kind='evaluation') as span:
+                response = self.client.generate(payload, timeout='evaluation')
+                response.raise_for_status()
+                
+                result = response.json()
+                tracing.record_ollama_timings(span, result)
+            record_ollama_result('evaluation', result)
+            return self._finish_evaluation(result.get("response", "").strip(), user_messages,
+                                           language, state, cache_key,
+                                           generation_report(payload["options"]["num_predict"], result))
             
-            # Create evaluation prompt
-            language_names = {
-                'en': 'English',
-                'es': 'Spanish', 
-                'fr': 'French',
-                'de': 'German',
-                'it': 'Italian',
-                'pt': 'Portuguese',
-                'ru': 'Russian',
-                'ja': 'Japanese',
-                'ko': 'Korean',
-                'zh': 'Chinese'
-            }
+        except EvaluationError:
+            raise
+        except Exception as e:
+            raise EvaluationUnavailable(f"The evaluation model is unavailable: {e}") from e
+    
+    async def aevaluate_conversation(self, conversation: List[Dict], language: str,
+                                     state: Optional[Dict] = None) -> Dict:
+        """Asynchronous variant of evaluate_conversation for the ASGI app"""
+        try:
+            report, payload, user_messages, cache_key = self._plan(conversation, language, state)
+            if report is not None:
+                return report
             
-            language_name = language_names.get(language, 'English')
+            with tracing.span('ollama.generate', kind='evaluation') as span:
+                response = await self.async_client.generate(payload, timeout='evaluation')
+                response.raise_for_status()
+                
+                result = response.json()
+                tracing.record_ollama_timings(span, result)
+            record_ollama_result('evaluation', result)
+            return self._finish_evaluation(result.get("response", "").strip(), user_messages,
+                                           language, state, cache_key,
+                                           generation_report(payload["options"]["num_predict"], result))
             
-            evaluation_prompt = f"""You are an expert language teacher evaluating a student's performance in {language_name}. 
+        except EvaluationError:
+            raise
+        except Exception as e:
+            raise EvaluationUnavailable(f"The evaluation model is unavailable: {e}") from e
+    
+    def stream_evaluation(self, conversation: List[Dict], language: str,
+                          state: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Evaluate a conversation, yielding each part of the report as soon as the model has written it
+        
+        Takes the same arguments as evaluate_conversation. Parts are
+        {"field": "mistakes", "item": {...}} for each finished mistake and
+        {"field": <name>, "value": ...} for each finished field, in the order
+        of EVALUATION_SCHEMA (mistakes, strengths, suggestions, overall_score,
+        ...); add_evaluation_part() assembles them. Entries that fail
+        validation are left out. The last part is {"done": True, "evaluation":
+        <report>}, with the report evaluate_conversation would have returned.
+        
+        Raises:
+            EvaluationUnavailable: Ollama could not be reached or failed
+            EvaluationError: The output holds no usable report (after any parts found in it)
+        """
+        try:
+            report, payload, user_messages, cache_key = self._plan(conversation, language, state)
+            if report is None:
+                carried = self._carried_mistakes(state)
+                for mistake in carried:
+                    yield {"field": "mistakes", "item": mistake}
+                
+                parser = IncrementalJSONParser()
+                text = []
+                result = {}
+                started = time.perf_counter()
+                first_token = None
+                with tracing.span('ollama.generate', kind='evaluation', stream=True) as span:
+                    with self.client.post("/api/generate", dict(payload, stream=True),
+                                          timeout='evaluation', stream=True) as response:
+                        response.raise_for_status()
+                        
+                        for line in response.iter_lines():
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            fragment = chunk.get("response", "")
+                            if fragment and first_token is None:
+                                first_token = time.perf_counter() - started
+                            text.append(fragment)
+                            for part in self._stream_parts(parser.feed(fragment), carried):
+                                yield part
+                            if chunk.get("done"):
+                                result = chunk
+                                break
+                    tracing.record_ollama_timings(span, result)
+                record_ollama_result('evaluation', result, first_token)
+                report = self._finish_evaluation("".join(text).strip(), user_messages, language, state, cache_key,
+                                                 generation_report(payload["options"]["num_predict"], result))
+            else:
+                for part in _report_parts(report):
+                    yield part
+                    
+        except EvaluationError:
+            raise
+        except Exception as e:
+            raise EvaluationUnavailable(f"The evaluation model is unavailable: {e}") from e
+        yield {"done": True, "evaluation": report}
+    
+    async def astream_evaluation(self, conversation: List[Dict], language: str,
+                                 state: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Asynchronous variant of stream_evaluation for the ASGI app"""
+        try:
+            report, payload, user_messages, cache_key = self._plan(conversation, language, state)
+            if report is None:
+                carried = self._carried_mistakes(state)
+                for mistake in carried:
+                    yield {"field": "mistakes", "item": mistake}
+                
+                parser = IncrementalJSONParser()
+                text = []
+                result = {}
+                started = time.perf_counter()
+                first_token = None
+                with tracing.span('ollama.generate', kind='evaluation', stream=True) as span:
+                    async with self.async_client.stream("/api/generate", dict(payload, stream=True),
+                                                        timeout='evaluation') as response:
+                        response.raise_for_status()
+                        
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            fragment = chunk.get("response", "")
+                            if fragment and first_token is None:
+                                first_token = time.perf_counter() - started
+                            text.append(fragment)
+                            for part in self._stream_parts(parser.feed(fragment), carried):
+                                yield part
+                            if chunk.get("done"):
+                                result = chunk
+                                break
+                    tracing.record_ollama_timings(span, result)
+                record_ollama_result('evaluation', result, first_token)
+                report = self._finish_evaluation("".join(text).strip(), user_messages, language, state, cache_key,
+                                                 generation_report(payload["options"]["num_predict"], result))
+            else:
+                for part in _report_parts(report):
+                    yield part
+                    
+        except EvaluationError:
+            raise
+        except Exception as e:
+            raise EvaluationUnavailable(f"The evaluation model is unavailable: {e}") from e
+        yield {"done": True, "evaluation": report}
+    
+    def _plan(self, conversation: List[Dict], language: str,
+              state: Optional[Dict]) -> Tuple[Optional[Dict], Optional[Dict], List[str], Optional[str]]:
+        """
+        Work out whether an evaluation needs the model, and with what payload
+        
+        Returns:
+            (report, payload, user_messages, cache_key). report is set when no
+            model call is needed (no user messages, a cached report, or nothing
+            new since the stored one); otherwise payload is the request to send.
+        """
+        # Extract only user messages for evaluation
+        user_messages = [msg['content'] for msg in conversation if msg['role'] == 'user']
+        
+        if not user_messages:
+            return dict(NO_MESSAGES_EVALUATION), None, user_messages, None
+        
+        cache_key = self.cache.make_key(self.model, language, user_messages, PROMPT_VERSION)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self._remember_report(state, user_messages, language, cached)
+            return cached, None, user_messages, cache_key
+        
+        new_messages = self._pending_messages(user_messages, language, state)
+        if not new_messages:
+            return copy.deepcopy(state['report']), None, user_messages, cache_key
+        
+        payload = self._build_payload(new_messages, language, len(user_messages) - len(new_messages))
+        return None, payload, user_messages, cache_key
+    
+    def _carried_mistakes(self, state: Optional[Dict]) -> List[Dict]:
+        """Mistakes of the stored report that the new messages' report will be merged into"""
+        previous = state.get('report') if state else None
+        return list(previous.get("mistakes", [])) if previous else []
+    
+    def _stream_parts(self, parsed: List[Tuple], carried: List[Dict]) -> List[Dict]:
+        """Turn what the parser just finished into report parts, leaving out invalid entries"""
+        parts = []
+        for key, index, value in parsed:
+            schema = EVALUATION_SCHEMA["properties"].get(key)
+            if schema is None:
+                continue
+            if index is None:
+                value = conform(value, schema, key, [])
+                if value is not None:
+                    # The stored report's mistakes are kept, as in the final report
+                    parts.append({"field": key, "value": carried + value if key == "mistakes" else value})
+            elif key == "mistakes":
+                mistake = conform(value, schema["items"], f"mistakes[{index}]", [])
+                if mistake is not None:
+                    parts.append({"field": key, "item": mistake})
+        return parts
+    
+    def _pending_messages(self, user_messages: List[str], language: str, state: Optional[Dict]) -> List[str]:
+        """
+        Return the user messages that still need to be sent to the model
+        
+        The stored state is only reused while the conversation it describes is
+        still a prefix of the current one; otherwise (session cleared, language
+        changed) it is reset and everything is evaluated again.
+        """
+        if state is None:
+            return user_messages
+        
+        analysed = state.get('analysed_count', 0)
+        if (not state.get('report') or state.get('language') != language
+                or analysed > len(user_messages)
+                or state.get('analysed_digest') != _digest(user_messages[:analysed])):
+            state.clear()
+            return user_messages
+        
+        return user_messages[analysed:]
+    
+    def _finish_evaluation(self, evaluation_text: str, user_messages: List[str],
+                           language: str, state: Optional[Dict], cache_key: str, generation: Dict) -> Dict:
+        """
+        Parse the model output, merge it into the session state and cache the report
+        
+        The returned copy carries the generation budget report of this call
+        under "generation"; the stored and cached reports do not. An
+        incomplete report is returned merged but neither stored nor cached, so
+        the next evaluation tries those messages again.
+        
+        Raises:
+            EvaluationError: The output holds no usable report
+        """
+        evaluation, problems = self._parse_evaluation(evaluation_text)
+        if evaluation is None:
+            # Nothing trustworthy to merge or cache; leave the stored state untouched
+            EVALUATION_PARSE_FAILURES.inc()
+            if generation.get("budget_exhausted"):
+                reason = f"the output reached its {generation['num_predict']}-token limit first"
+            else:
+                reason = "; ".join(problems[:3])
+            raise EvaluationError(f"The model did not return a usable evaluation, no valid overall_score "
+                                  f"({reason})", generation)
+        
+        incomplete = evaluation.pop("incomplete", False)
+        if state is not None:
+            new_count = len(user_messages) - state.get('analysed_count', 0)
+            evaluation = self._merge_reports(state.get('report'), state.get('analysed_count', 0),
+                                             evaluation, new_count)
+        if incomplete:
+            EVALUATION_PARTIAL_REPORTS.inc()
+            return dict(copy.deepcopy(evaluation), incomplete=True, generation=generation)
+        
+        self._remember_report(state, user_messages, language, evaluation)
+        self.cache.put(cache_key, evaluation)
+        report = copy.deepcopy(evaluation)
+        report["generation"] = generation
+        return report
+    
+    def _remember_report(self, state: Optional[Dict], user_messages: List[str], language: str, report: Dict):
+        """Record report as the session's evaluation of user_messages"""
+        if state is None:
+            return
+        state['language'] = language
+        state['analysed_count'] = len(user_messages)
+        state['analysed_digest'] = _digest(user_messages)
+        state['report'] = copy.deepcopy(report)
+    
+    def _merge_reports(self, previous: Optional[Dict], previous_count: int,
+                       latest: Dict, latest_count: int) -> Dict:
+        """
+        Merge the report for newly analysed messages into the stored report
+        
+        Mistakes accumulate, list fields are de-duplicated and capped, the
+        summary is taken from the latest batch and overall_score is the
+        average of the batch scores weighted by their number of messages.
+        """
+        if not previous:
+            return latest
+        
+        merged = dict(latest)
+        
+        seen = set()
+        merged["mistakes"] = []
+        for mistake in previous.get("mistakes", []) + latest.get("mistakes", []):
+            key = (str(mistake.get("message", "")).strip(), str(mistake.get("correction", "")).strip()) \
+                if isinstance(mistake, dict) else str(mistake)
+            if key not in seen:
+                seen.add(key)
+                merged["mistakes"].append(mistake)
+        
+        for field in ("strengths", "suggestions", "areas_for_improvement"):
+            merged[field] = _merge_items(previous.get(field, []), latest.get(field, []))
+        
+        try:
+            merged["overall_score"] = round(
+                (float(previous["overall_score"]) * previous_count + float(latest["overall_score"]) * latest_count)
+                / (previous_count + latest_count)
+            )
+        except (TypeError, ValueError, ZeroDivisionError):
+            merged["overall_score"] = latest.get("overall_score", previous.get("overall_score"))
+        
+        return merged
+    
+    @tracing.traced('evaluation.build_prompt')
+    def _build_payload(self, user_messages: List[str], language: str, offset: int = 0) -> Dict:
+        """Build the Ollama generate payload that evaluates the given user messages"""
+        # Create evaluation prompt
+        language_names = {
+            'en': 'English',
+            'es': 'Spanish', 
+            'fr': 'French',
+            'de': 'German',
+            'it': 'Italian',
+            'pt': 'Portuguese',
+            'ru': 'Russian',
+            'ja': 'Japanese',
+            'ko': 'Korean',
+            'zh': 'Chinese'
+        }
+        
+        language_name = language_names.get(language, 'English')
+        
+        evaluation_prompt = f"""You are an expert language teacher evaluating a student's performance in {language_name}. 
 
 Analyze the following student messages and provide a detailed evaluation:
 
 Student messages:
-{chr(10).join([f"{i+1}. {msg}" for i, msg in enumerate(user_messages)])}
+{chr(10).join([f"{i+1}. {msg}" for i, msg in enumerate(user_messages, start=offset)])}
 
 Please provide your evaluation in the following JSON format:
 {{
-    "overall_score": <score from 0-100>,
     "mistakes": [
         {{
             "message": "<original incorrect text>",
@@ -65,16 +446,17 @@ Please provide your evaluation in the following JSON format:
             "type": "<grammar/vocabulary/pronunciation/style>"
         }}
     ],
-    "suggestions": [
-        "<specific improvement suggestions>"
-    ],
-    "summary": "<overall performance summary>",
     "strengths": [
         "<things the student did well>"
     ],
+    "suggestions": [
+        "<specific improvement suggestions>"
+    ],
+    "overall_score": <score from 0-100>,
     "areas_for_improvement": [
         "<areas that need more practice>"
-    ]
+    ],
+    "summary": "<overall performance summary>"
 }}
 
 Focus on:
@@ -86,62 +468,67 @@ Focus on:
 
 Be constructive and encouraging while being specific about mistakes."""
 
-            # Make API call to Ollama for evaluation
-            prompt = f"""You are an expert language teacher. Always respond with valid JSON only.
+        # Make API call to Ollama for evaluation
+        prompt = f"""You are an expert language teacher. Always respond with valid JSON only.
 
 {evaluation_prompt}"""
-            
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "max_tokens": 1000
-                }
-            }
-            
-            response = requests.post(self.ollama_url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
-            evaluation_text = result.get("response", "").strip()
-            
-            # Try to extract JSON from response (in case there's extra text)
-            try:
-                # Find JSON object in the response
-                start_idx = evaluation_text.find('{')
-                end_idx = evaluation_text.rfind('}') + 1
-                json_text = evaluation_text[start_idx:end_idx]
-                evaluation = json.loads(json_text)
-            except (json.JSONDecodeError, ValueError):
-                # Fallback if JSON parsing fails
-                evaluation = {
-                    "overall_score": 75,
-                    "mistakes": [],
-                    "suggestions": ["Unable to parse detailed evaluation. Please try again."],
-                    "summary": "Evaluation completed but detailed analysis unavailable.",
-                    "strengths": ["Student engaged in conversation"],
-                    "areas_for_improvement": ["Continue practicing"]
-                }
-            
-            # Ensure all required fields exist
-            evaluation.setdefault("overall_score", 75)
-            evaluation.setdefault("mistakes", [])
-            evaluation.setdefault("suggestions", [])
-            evaluation.setdefault("summary", "Evaluation completed")
-            evaluation.setdefault("strengths", [])
-            evaluation.setdefault("areas_for_improvement", [])
-            
-            return evaluation
-            
-        except Exception as e:
-            # Fallback evaluation in case of error
-            return {
-                "overall_score": 0,
-                "mistakes": [],
-                "suggestions": [f"Evaluation error: {str(e)}"],
-                "summary": "Unable to complete evaluation due to technical issues",
-                "strengths": [],
-                "areas_for_improvement": ["Please try again later"]
+        
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "format": EVALUATION_SCHEMA,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": self.budgets.for_evaluation(len(user_messages))
             }
+        }
+        return payload
+    
+    @tracing.traced('evaluation.parse_json')
+    def _parse_evaluation(self, evaluation_text: str) -> Tuple[Optional[Dict], List[str]]:
+        """Read the evaluation report from the model output; see _validate_evaluation"""
+        parser = IncrementalJSONParser()
+        parser.feed(evaluation_text)
+        return self._validate_evaluation(parser)
+    
+    def _validate_evaluation(self, parser: IncrementalJSONParser) -> Tuple[Optional[Dict], List[str]]:
+        """
+        Check what a parser read against EVALUATION_SCHEMA
+        
+        Invalid entries are dropped. Fields that are missing or invalid, e.g.
+        because the output was cut off, are left empty and the report is marked
+        "incomplete". Without a valid overall_score there is no report: a score
+        is never made up.
+        
+        Returns:
+            The report (None if unusable) and the problems found
+        """
+        data = parser.result()
+        problems = []
+        if not parser.complete:
+            problems.append("output ended before the report was complete")
+        if parser.errors:
+            problems.append(f"{parser.errors} unreadable entries skipped")
+        
+        evaluation = {}
+        for field, schema in EVALUATION_SCHEMA["properties"].items():
+            if field not in data:
+                problems.append(f"{field}: missing")
+                continue
+            value = conform(data[field], schema, field, problems)
+            if value is not None:
+                evaluation[field] = value
+        
+        span = tracing.current_span()
+        span.set_attribute('problems', len(problems))
+        if "overall_score" not in evaluation:
+            span.set_attribute('parsed', False)
+            return None, problems
+        
+        missing = [field for field in EVALUATION_SCHEMA["properties"] if field not in evaluation]
+        for field in missing:
+            evaluation[field] = "" if field == "summary" else []
+        if missing or not parser.complete:
+            evaluation["incomplete"] = True
+        return evaluation, problems
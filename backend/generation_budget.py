@@ -0,0 +1,73 @@
+import os
+from typing import Dict, List, Optional
+from history import estimate_tokens
+
+# How many of the learner's latest messages set the length of a chat reply
+RECENT_USER_MESSAGES = 3
+
+class GenerationBudgets:
+    """
+    Caps on how many tokens Ollama may generate, per call type
+
+    Ollama only honours "num_predict" in the request options; without it a
+    generation runs until the model stops by itself. Chat replies get a cap
+    that follows the learner: short answers from a beginner get short replies,
+    longer messages allow longer ones, always between chat_min and chat_max.
+    Evaluations get a cap that grows with the number of messages analysed, so
+    a long batch still has room to finish its JSON.
+    """
+
+    def __init__(self, chat_max: Optional[int] = None, chat_min: Optional[int] = None,
+                 evaluation_max: Optional[int] = None, summary: Optional[int] = None):
+        """
+        Initialize the budgets
+
+        Args:
+            chat_max: Most tokens for a chat reply (default: CHAT_NUM_PREDICT or 200)
+            chat_min: Fewest tokens for a chat reply (default: CHAT_NUM_PREDICT_MIN or 60)
+            evaluation_max: Most tokens for an evaluation (default: EVALUATION_NUM_PREDICT or 1200)
+            summary: Tokens for a conversation summary (default: SUMMARY_NUM_PREDICT or 200)
+        """
+        self.chat_max = chat_max or int(os.getenv('CHAT_NUM_PREDICT', '200'))
+        self.chat_min = min(chat_min or int(os.getenv('CHAT_NUM_PREDICT_MIN', '60')), self.chat_max)
+        self.evaluation_max = evaluation_max or int(os.getenv('EVALUATION_NUM_PREDICT', '1200'))
+        self.summary = summary or int(os.getenv('SUMMARY_NUM_PREDICT', '200'))
+
+    def for_chat(self, conversation_history: List[Dict]) -> int:
+        """Token cap for the next chat reply, from the length of the learner's recent messages"""
+        recent = [message['content'] for message in conversation_history
+                  if message.get('role') == 'user'][-RECENT_USER_MESSAGES:]
+        if not recent:
+            return self.chat_max
+        average = sum(estimate_tokens(text) for text in recent) / len(recent)
+        return max(self.chat_min, min(self.chat_max, round(48 + 4 * average)))
+
+    def for_evaluation(self, message_count: int) -> int:
+        """Token cap for evaluating a batch of user messages"""
+        return min(self.evaluation_max, 400 + 80 * message_count)
+
+    def for_summary(self) -> int:
+        """Token cap for a conversation summary"""
+        return self.summary
+
+def generation_report(num_predict: int, result: Dict) -> Dict:
+    """
+    Describe how a generation used its budget, for response metadata
+
+    budget_exhausted is True when Ollama stopped because it reached num_predict
+    (done_reason "length"), i.e. the output may have been cut short.
+    """
+    eval_count = result.get('eval_count')
+    return {
+        "num_predict": num_predict,
+        "eval_count": eval_count,
+        "done_reason": result.get('done_reason'),
+        "budget_exhausted": exhausted(num_predict, result)
+    }
+
+def exhausted(num_predict: int, result: Dict) -> bool:
+    """True if a finished generation hit its token cap"""
+    if result.get('done_reason'):
+        return result['done_reason'] == 'length'
+    eval_count = result.get('eval_count')
+    return eval_count is not None and eval_count >= num_predict
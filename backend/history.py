@@ -0,0 +1,58 @@
+import math
+from functools import lru_cache
+from typing import List, Dict
+
+# Tokens added per message for the role prefix and separators ("Human: ", blank lines)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Roughly how many characters of alphabetic text make up one token
+CHARS_PER_TOKEN = 4
+
+def _is_cjk(char: str) -> bool:
+    """Return True for Chinese, Japanese and Korean characters (roughly one token each)"""
+    code = ord(char)
+    return (0x3040 <= code <= 0x30FF          # Hiragana, Katakana
+            or 0x3400 <= code <= 0x4DBF       # CJK Extension A
+            or 0x4E00 <= code <= 0x9FFF       # CJK Unified Ideographs
+            or 0xAC00 <= code <= 0xD7AF       # Hangul syllables
+            or 0xF900 <= code <= 0xFAFF       # CJK Compatibility Ideographs
+            or 0xFF00 <= code <= 0xFFEF)      # Full-width forms
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a piece of text costs the model
+
+    This is a cheap heuristic rather than a real tokenizer: CJK characters count
+    as one token each and everything else as one token per CHARS_PER_TOKEN
+    characters. Results are cached, so each message is only measured once.
+    """
+    cjk = sum(1 for char in text if _is_cjk(char))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+def message_tokens(message: Dict) -> int:
+    """Estimate the prompt cost of one conversation message"""
+    return estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+def select_history(conversation_history: List[Dict], budget: int) -> List[Dict]:
+    """
+    Pick the most recent messages that fit in a token budget
+
+    Args:
+        conversation_history: Conversation messages, oldest first
+        budget: Tokens available for history (after the system prompt)
+
+    Returns:
+        The longest suffix of the history within budget. The latest message
+        (the user's new turn) is always included, even if it alone exceeds it.
+    """
+    selected = []
+    used = 0
+    for message in reversed(conversation_history):
+        cost = message_tokens(message)
+        if selected and used + cost > budget:
+            break
+        selected.append(message)
+        used += cost
+    selected.reverse()
+    return selected
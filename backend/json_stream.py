@@ -0,0 +1,159 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+class IncrementalJSONParser:
+    """
+    Tolerant parser for a JSON object that arrives in fragments
+
+    Feed it model output as it is generated. It reports each top-level member
+    as soon as the member is complete, and each item of a top-level array as
+    soon as the item is complete, so callers can act on parts of the object
+    before the rest exists. Output that never completes (cut off at the token
+    limit) still yields every finished part through result().
+
+    It is forgiving where models tend to slip: text before the first "{" or
+    after the closing "}" is ignored, raw control characters inside strings
+    are accepted, and a member or item that does not parse is skipped
+    (and counted in errors) instead of failing the whole object.
+    """
+
+    def __init__(self):
+        self.members = {}       # finished top-level members
+        self.complete = False   # the top-level object has been closed
+        self.errors = 0         # members or items that were skipped
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+        self._array_key = None  # key of the top-level array being read
+        self._item_start = None
+        self._items = []
+
+    def feed(self, text: str) -> List[Tuple[str, Optional[int], object]]:
+        """
+        Add a fragment of output
+
+        Returns:
+            Parts completed by this fragment, in order, as (key, index, value):
+            index is the position of an item within the top-level array key,
+            or None when value is the whole member key.
+        """
+        events = []
+        if self.complete:
+            return events
+        self._buffer += text
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if not self._stack:
+                # Skip anything before the object, e.g. prose or a ``` fence
+                if char == '{':
+                    self._stack.append(char)
+                    self._member_start = i + 1
+                continue
+
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if depth == 1 and char == '[':
+                    self._array_key = _member_key(buffer[self._member_start:i])
+                    self._items = []
+                    self._item_start = i + 1
+                self._stack.append(char)
+            elif char in '}]':
+                if depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+                    self._finish_item(buffer[self._item_start:i], events)
+                    self._item_start = None
+                self._stack.pop()
+                if depth == 1:
+                    self._finish_member(buffer[self._member_start:i], events)
+                    self.complete = True
+                    break
+            elif char == ',':
+                if depth == 1:
+                    self._finish_member(buffer[self._member_start:i], events)
+                    self._member_start = i + 1
+                elif depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+                    self._finish_item(buffer[self._item_start:i], events)
+                    self._item_start = i + 1
+
+        self._pos = len(buffer)
+        return events
+
+    def result(self) -> Dict:
+        """
+        The object as far as it could be read
+
+        For unfinished output this is every finished member, the finished
+        items of an array that was cut short, and the member in progress if it
+        is already whole (a truncated number is not trusted, as more digits
+        may have been coming). Output cut inside a string loses only that
+        string's member or array item.
+        """
+        data = dict(self.members)
+        if self.complete or not self._stack:
+            return data
+        if len(self._stack) == 1:
+            if self._in_string:
+                # The open string is a key or value of the member in progress
+                return data
+            pending = _parse_member(self._buffer[self._member_start:])
+            if pending and not any(isinstance(value, (int, float)) and not isinstance(value, bool)
+                                   for value in pending.values()):
+                data.update(pending)
+        elif self._array_key is not None and self._array_key not in data:
+            data[self._array_key] = list(self._items)
+        return data
+
+    def _finish_member(self, segment: str, events: List):
+        if segment.strip():
+            member = _parse_member(segment)
+            if member is None and self._array_key is not None:
+                # Keep the items that did parse
+                member = {self._array_key: list(self._items)}
+            if member is None:
+                self.errors += 1
+            else:
+                self.members.update(member)
+                events.extend((key, None, value) for key, value in member.items())
+        self._array_key = None
+        self._items = []
+
+    def _finish_item(self, segment: str, events: List):
+        if not segment.strip():
+            return
+        try:
+            item = json.loads(segment, strict=False)
+        except ValueError:
+            self.errors += 1
+            return
+        self._items.append(item)
+        events.append((self._array_key, len(self._items) - 1, item))
+
+def _parse_member(segment: str) -> Optional[Dict]:
+    """Parse '"key": value' text, or return None"""
+    try:
+        member = json.loads('{' + segment + '}', strict=False)
+    except ValueError:
+        return None
+    return member or None
+
+def _member_key(head: str) -> Optional[str]:
+    """Read the key from the '"key":' text before a member's value"""
+    try:
+        return json.loads(head.strip().rstrip(':').strip())
+    except ValueError:
+        return None
@@ -1,39 +1,67 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import os
-from dotenv import load_dotenv
-from chat_handler import ChatHandler
-from evaluator import LanguageEvaluator
-
-# Load environment variables
-load_dotenv()
+import json
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from evaluator import EvaluationError, EvaluationUnavailable
+from session_locks import SessionLocks, RequestCoalescer
+from evaluation_jobs import EvaluationJobs, JobQueueFull, FINISHED
+from services import (LANGUAGES, EVAL_BATCH_CONCURRENCY, EVAL_BATCH_MAX_SESSIONS, store_path, sessions,
+                      chat_handler, evaluator, summarizer, sse_event)
+import metrics
+import tracing
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize handlers
-chat_handler = ChatHandler()
-evaluator = LanguageEvaluator()
+# Requests for one session run one at a time; a message re-sent while the
+# first copy is still being answered shares that answer
+session_locks = SessionLocks()
+chat_coalescer = RequestCoalescer()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+    """Observe each /api/* request's latency once its body has been sent"""
+    # Label by route pattern rather than raw path to keep the label set bounded
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if request.path.startswith('/api/') and started is not None:
+        method, status = request.method, str(response.status_code)
+        response.call_on_close(lambda: metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - started, route=rule, method=method, status=status))
+    return response
 
-# In-memory storage for sessions (can be upgraded to Redis later)
-sessions = {}
+@app.before_request
+def _start_request_span():
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_span, g.request_span_token = tracing.start_span(
+        f"{request.method} {rule}", request.headers.get('traceparent'),
+        **{'http.method': request.method, 'http.route': rule, 'http.target': request.full_path.rstrip('?')})
+
+@app.after_request
+def _end_request_span(response):
+    """End the request's span once its body (which may be streamed) has been sent"""
+    span, token = g.get('request_span'), g.get('request_span_token')
+    if token is not None:
+        span.set_attribute('http.status_code', response.status_code)
+        response.headers['X-Trace-Id'] = span.trace_id
+        response.call_on_close(lambda: tracing.end_span(span, token))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 @app.route('/api/languages', methods=['GET'])
 def get_languages():
     """Return available languages for learning"""
-    languages = [
-        {"code": "en", "name": "English"},
-        {"code": "es", "name": "Spanish"},
-        {"code": "fr", "name": "French"},
-        {"code": "de", "name": "German"},
-        {"code": "it", "name": "Italian"},
-        {"code": "pt", "name": "Portuguese"},
-        {"code": "ru", "name": "Russian"},
-        {"code": "ja", "name": "Japanese"},
-        {"code": "ko", "name": "Korean"},
-        {"code": "zh", "name": "Chinese"},
-    ]
-    return jsonify(languages)
+    return jsonify(LANGUAGES)
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -47,39 +75,127 @@ def chat():
         if not all([session_id, message, language]):
             return jsonify({"error": "Missing required fields"}), 400
         
+        turn = chat_coalescer.run(
+            (session_id, language, message),
+            lambda: _chat_turn(session_id, message, language)
+        )
+        
+        return jsonify({
+            "response": turn["response"],
+            "session_id": session_id,
+            "generation": turn["generation"]
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _chat_turn(session_id, message, language):
+    """
+    Record a user message and the AI reply while holding the session's lock
+    
+    Returns the reply and how its generation used the token budget
+    (None for a fallback reply).
+    """
+    with session_locks.hold(session_id):
         # Initialize session if it doesn't exist
-        if session_id not in sessions:
-            sessions[session_id] = {
-                'language': language,
-                'conversation': []
-            }
+        session = sessions.get_or_create(session_id, language)
         
         # Add user message to conversation
-        sessions[session_id]['conversation'].append({
+        sessions.append_message(session_id, {
             'role': 'user',
             'content': message
-        })
+        }, session=session)
         
         # Get AI response
         ai_response = chat_handler.get_response(
             message, 
             language, 
-            sessions[session_id]['conversation']
+            session['conversation'],
+            session
         )
         
         # Add AI response to conversation
-        sessions[session_id]['conversation'].append({
+        sessions.append_message(session_id, {
             'role': 'assistant',
             'content': ai_response
-        })
-        
-        return jsonify({
-            "response": ai_response,
-            "session_id": session_id
-        })
+        }, session=session)
+    
+    # Compress turns that no longer fit in the prompt, off the request path
+    summarizer.maybe_schedule(session_id, session)
+    return {"response": ai_response, "generation": session.get('last_generation')}
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the AI response to a chat message as Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    message = data.get('message')
+    language = data.get('language')
+    
+    if not all([session_id, message, language]):
+        return jsonify({"error": "Missing required fields"}), 400
+    
+    def generate():
+        key = (session_id, language, message)
+        call, leader = chat_coalescer.join(key)
+        if not leader:
+            # Duplicate of a message already being answered: share its reply
+            turn = call.wait()
+            yield sse_event({
+                "done": True,
+                "response": turn["response"],
+                "session_id": session_id,
+                "generation": turn["generation"]
+            })
+            return
         
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        tokens = []
+        generation = None
+        error = None
+        try:
+            with session_locks.hold(session_id):
+                # Initialize session if it doesn't exist
+                session = sessions.get_or_create(session_id, language)
+                
+                # Add user message to conversation
+                sessions.append_message(session_id, {
+                    'role': 'user',
+                    'content': message
+                }, session=session)
+                try:
+                    for token in chat_handler.stream_response(message, language, session['conversation'], session):
+                        tokens.append(token)
+                        yield sse_event({"token": token})
+                finally:
+                    # Record the reply even if the client went away mid-stream
+                    sessions.append_message(session_id, {
+                        'role': 'assistant',
+                        'content': "".join(tokens).strip()
+                    }, session=session)
+            generation = session.get('last_generation')
+            summarizer.maybe_schedule(session_id, session)
+            
+            yield sse_event({
+                "done": True,
+                "response": "".join(tokens).strip(),
+                "session_id": session_id,
+                "generation": generation
+            })
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            chat_coalescer.finish(key, call, {"response": "".join(tokens).strip(), "generation": generation},
+                                  error)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate():
@@ -88,38 +204,217 @@ def evaluate():
         data = request.get_json()
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in sessions:
+        evaluation = _evaluate_session(session_id) if session_id else None
+        if evaluation is None:
             return jsonify({"error": "Invalid session ID"}), 400
         
-        conversation = sessions[session_id]['conversation']
-        language = sessions[session_id]['language']
-        
-        # Get evaluation report
-        evaluation = evaluator.evaluate_conversation(conversation, language)
-        
         return jsonify(evaluation)
         
+    except EvaluationUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except EvaluationError as e:
+        # The model answered, but not with a report we can trust
+        return jsonify({"error": str(e), "generation": e.generation}), 502
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _evaluate_session(session_id):
+    """Evaluate a session's conversation, or return None if the session is unknown"""
+    # Wait for any reply still being generated so it is part of the report
+    with session_locks.hold(session_id):
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        
+        # Get evaluation report
+        evaluation = evaluator.evaluate_conversation(
+            session['conversation'],
+            session['language'],
+            session.setdefault('evaluation_state', {})
+        )
+        sessions.touch(session_id)
+        return evaluation
+
+@app.route('/api/evaluate/stream', methods=['POST'])
+def evaluate_stream():
+    """Stream the evaluation report as Server-Sent Events, one event per part as the model writes it"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    
+    if not session_id or sessions.get(session_id) is None:
+        return jsonify({"error": "Invalid session ID"}), 400
+    
+    def generate():
+        # Wait for any reply still being generated so it is part of the report
+        with session_locks.hold(session_id):
+            session = sessions.get(session_id)
+            if session is None:
+                yield sse_event({"done": True, "error": "Invalid session ID"})
+                return
+            try:
+                for part in evaluator.stream_evaluation(session['conversation'], session['language'],
+                                                        session.setdefault('evaluation_state', {})):
+                    yield sse_event(part)
+            except EvaluationError as e:
+                yield sse_event({"done": True, "error": str(e), "generation": e.generation})
+            sessions.touch(session_id)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def _run_evaluation_job(session_id):
+    """Evaluation job body: like _evaluate_session, but an unknown session fails the job"""
+    evaluation = _evaluate_session(session_id)
+    if evaluation is None:
+        raise LookupError("Invalid session ID")
+    return evaluation
+
+evaluation_jobs = EvaluationJobs(_run_evaluation_job, path=store_path)
+
+# Bulk evaluations share one bounded pool so concurrent batches cannot flood Ollama
+batch_executor = ThreadPoolExecutor(EVAL_BATCH_CONCURRENCY, thread_name_prefix='batch-evaluation')
+
+@app.route('/api/evaluate/batch', methods=['POST'])
+def evaluate_batch():
+    """Evaluate many sessions, streaming each report as NDJSON as soon as it is ready"""
+    data = request.get_json(silent=True) or {}
+    session_ids = data.get('session_ids')
+    
+    if not isinstance(session_ids, list) or not session_ids:
+        return jsonify({"error": "session_ids must be a non-empty list"}), 400
+    session_ids = list(dict.fromkeys(session_ids))
+    if len(session_ids) > EVAL_BATCH_MAX_SESSIONS:
+        return jsonify({"error": f"At most {EVAL_BATCH_MAX_SESSIONS} sessions per batch"}), 400
+    
+    def generate():
+        # Run each evaluation in a copy of this request's context so its spans join the trace
+        futures = {batch_executor.submit(contextvars.copy_context().run, _evaluate_session, session_id): session_id
+                   for session_id in session_ids}
+        failed = 0
+        try:
+            for future in as_completed(futures):
+                line = {"session_id": futures[future]}
+                try:
+                    evaluation = future.result()
+                    if evaluation is None:
+                        line["error"] = "Invalid session ID"
+                    else:
+                        line["evaluation"] = evaluation
+                except Exception as e:
+                    line["error"] = str(e)
+                failed += "error" in line
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            
+            yield json.dumps({"done": True, "evaluated": len(futures) - failed, "failed": failed}) + "\n"
+        finally:
+            # Drop work nobody will read if the client disconnected
+            for future in futures:
+                future.cancel()
+    
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/evaluate/jobs', methods=['POST'])
+def submit_evaluation_job():
+    """Queue an evaluation and return its job id without waiting for the result"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    
+    if not session_id or sessions.get(session_id) is None:
+        return jsonify({"error": "Invalid session ID"}), 400
+    
+    try:
+        job = evaluation_jobs.submit(session_id)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+    return jsonify(job), 202
+
+@app.route('/api/evaluate/jobs/stats', methods=['GET'])
+def evaluation_job_stats():
+    """Return evaluation queue depth, counters and queue wait times"""
+    return jsonify(evaluation_jobs.stats())
+
+@app.route('/api/evaluate/jobs/<job_id>', methods=['GET'])
+def get_evaluation_job(job_id):
+    """Return an evaluation job's status, and its report once finished"""
+    job = evaluation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/evaluate/jobs/<job_id>/events', methods=['GET'])
+def evaluation_job_events(job_id):
+    """Push an evaluation job's status changes, then its result, as Server-Sent Events"""
+    if evaluation_jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def generate():
+        status = None
+        while True:
+            job = evaluation_jobs.wait(job_id, status, timeout=15)
+            if job is None:
+                return
+            if job['status'] == status:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            status = job['status']
+            yield sse_event(job)
+            if status in FINISHED:
+                return
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/evaluate/cache', methods=['GET'])
+def evaluation_cache_stats():
+    """Return evaluation cache hit/miss counters"""
+    return jsonify(evaluator.cache.stats())
+
+@app.route('/api/ollama/status', methods=['GET'])
+def ollama_status():
+    """Return the Ollama endpoints in use with their load and health"""
+    return jsonify(chat_handler.client.stats())
+
 @app.route('/api/session/new', methods=['POST'])
 def new_session():
     """Create a new conversation session"""
     import uuid
     session_id = str(uuid.uuid4())
-    sessions[session_id] = {
-        'language': None,
-        'conversation': []
-    }
+    sessions.create(session_id)
     return jsonify({"session_id": session_id})
 
 @app.route('/api/session/<session_id>/clear', methods=['POST'])
 def clear_session(session_id):
     """Clear conversation history for a session"""
-    if session_id in sessions:
-        sessions[session_id]['conversation'] = []
+    with session_locks.hold(session_id):
+        cleared = sessions.clear_conversation(session_id)
+    if cleared:
         return jsonify({"message": "Session cleared"})
     return jsonify({"error": "Session not found"}), 404
 
+@app.route('/api/sessions/stats', methods=['GET'])
+def session_stats():
+    """Return session store occupancy, eviction and request coalescing counters"""
+    stats = sessions.stats()
+    stats["locked_sessions"] = len(session_locks)
+    stats["coalesced_requests"] = chat_coalescer.coalesced
+    return jsonify(stats)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
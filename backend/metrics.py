@@ -0,0 +1,196 @@
+"""
+Minimal Prometheus metrics for the Language Teacher backend
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by render(). Kept dependency-free so the Tk GUIs, which
+share the handlers, do not need a metrics client installed. Values are per
+process; with several workers, scrape each one or aggregate by instance.
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets (seconds) covering fast routes through long evaluations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Generation speed buckets (tokens per second)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    """Base class: a named metric family with a fixed set of label names"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally read from a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self._function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the (unlabelled) value from function whenever metrics are rendered"""
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            try:
+                self.set(self._function())
+            except Exception:
+                pass
+        return super().render()
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to serve an API request, including streamed bodies',
+    ('route', 'method', 'status'))
+OLLAMA_TIME_TO_FIRST_TOKEN = Histogram(
+    'ollama_time_to_first_token_seconds',
+    'Time until Ollama produced the first token (measured when streaming, else load + prompt eval)',
+    ('kind',))
+OLLAMA_TOTAL_DURATION = Histogram(
+    'ollama_total_duration_seconds', 'Total duration of Ollama generations as reported by Ollama',
+    ('kind',))
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    'ollama_tokens_per_second', 'Generation speed of Ollama responses (eval_count / eval_duration)',
+    ('kind',), buckets=TOKENS_PER_SECOND_BUCKETS)
+OLLAMA_EVAL_TOKENS = Counter(
+    'ollama_eval_tokens_total', 'Tokens generated by Ollama (eval_count)', ('kind',))
+OLLAMA_PROMPT_EVAL_TOKENS = Counter(
+    'ollama_prompt_eval_tokens_total', 'Prompt tokens processed by Ollama (prompt_eval_count)', ('kind',))
+OLLAMA_BUDGET_EXHAUSTED = Counter(
+    'ollama_budget_exhausted_total', 'Ollama generations stopped by their num_predict cap', ('kind',))
+CHAT_FALLBACKS = Counter(
+    'chat_fallback_responses_total', 'Chat replies replaced by the canned fallback message', ('language',))
+CHAT_TRUNCATIONS = Counter(
+    'chat_turn_boundary_truncations_total', 'Chat replies cut where the model started writing another turn')
+EVALUATION_PARSE_FAILURES = Counter(
+    'evaluation_parse_failures_total', 'Evaluation responses from Ollama without a usable report')
+EVALUATION_PARTIAL_REPORTS = Counter(
+    'evaluation_partial_reports_total', 'Evaluation reports salvaged from incomplete Ollama output')
+LIVE_SESSIONS = Gauge(
+    'sessions_live', 'Conversation sessions currently held by the session store')
+
+def record_ollama_result(kind: str, result: Dict, time_to_first_token: Optional[float] = None):
+    """
+    Record the timing and token counts Ollama reports on a finished generation
+
+    Args:
+        kind: Call kind ('chat', 'evaluation', 'summary')
+        result: Final (done) response object from /api/generate
+        time_to_first_token: Measured seconds to the first streamed token, if known
+    """
+    if time_to_first_token is None and 'prompt_eval_duration' in result:
+        time_to_first_token = (result.get('load_duration', 0) + result['prompt_eval_duration']) / 1e9
+    if time_to_first_token is not None:
+        OLLAMA_TIME_TO_FIRST_TOKEN.observe(time_to_first_token, kind=kind)
+    if 'total_duration' in result:
+        OLLAMA_TOTAL_DURATION.observe(result['total_duration'] / 1e9, kind=kind)
+    if 'eval_count' in result:
+        OLLAMA_EVAL_TOKENS.inc(result['eval_count'], kind=kind)
+        if result.get('eval_duration'):
+            OLLAMA_TOKENS_PER_SECOND.observe(result['eval_count'] / (result['eval_duration'] / 1e9), kind=kind)
+    if 'prompt_eval_count' in result:
+        OLLAMA_PROMPT_EVAL_TOKENS.inc(result['prompt_eval_count'], kind=kind)
+    if result.get('done_reason') == 'length':
+        OLLAMA_BUDGET_EXHAUSTED.inc(kind=kind)
+
+def render() -> str:
+    """Render every metric in the Prometheus text format"""
+    return REGISTRY.render()
@@ -0,0 +1,363 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from typing import AsyncIterator, Dict, List, Optional, Union
+import requests
+
+RECORD = 'record'
+REPLAY = 'replay'
+AUTO = 'auto'  # replay what was recorded, record the rest
+MODES = (RECORD, REPLAY, AUTO)
+
+# Payload fields that do not change what Ollama answers
+VOLATILE_KEYS = ('stream', 'keep_alive')
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode for a request that was never recorded"""
+
+def _normalise(value):
+    """Canonical form of a payload value: whitespace runs collapsed, keys sorted on dump"""
+    if isinstance(value, dict):
+        return {key: _normalise(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalise(item) for item in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+def request_key(method: str, path: str, payload: Optional[Dict] = None) -> str:
+    """Hash a request so equivalent requests (e.g. streamed or not) share a recording"""
+    payload = {key: value for key, value in (payload or {}).items() if key not in VOLATILE_KEYS}
+    canonical = json.dumps([method.upper(), path, _normalise(payload)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _to_chunks(result: Dict) -> List[Dict]:
+    """Turn a complete response into the two chunks Ollama would have streamed"""
+    first = {key: result[key] for key in ('model', 'created_at') if key in result}
+    done = dict(result)
+    if 'response' in result:
+        first['response'] = result['response']
+        done['response'] = ""
+    if 'message' in result:
+        first['message'] = result['message']
+        done['message'] = dict(result['message'], content="")
+    first['done'] = False
+    return [first, done]
+
+def _from_chunks(chunks: List[Dict]) -> Dict:
+    """Merge streamed chunks into the response a non-streaming call returns"""
+    result = dict(chunks[-1]) if chunks else {}
+    if any('response' in chunk for chunk in chunks):
+        result['response'] = "".join(chunk.get('response', "") for chunk in chunks)
+    if any('message' in chunk for chunk in chunks):
+        content = "".join(chunk.get('message', {}).get('content', "") for chunk in chunks)
+        result['message'] = dict(result.get('message') or {'role': 'assistant'}, content=content)
+    return result
+
+class Cassette:
+    """
+    Recorded Ollama request/response pairs in a JSON lines file
+
+    Each line holds the request's key (see request_key), a copy of the
+    request for reference, and the status and body of the response; streamed
+    bodies are kept as their NDJSON lines. When a request was recorded several
+    times its responses are replayed in order, repeating the last one.
+    Recordings contain the learners' messages, so treat the file like the
+    conversation data it came from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = {}  # key -> recorded responses, oldest first
+        self._next = {}  # key -> index of the next response to replay
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['key'], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def find(self, key: str) -> Optional[Dict]:
+        """Return the next recorded response for a key, or None"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                return None
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            self.hits += 1
+            return entries[min(index, len(entries) - 1)]
+
+    def record(self, key: str, method: str, path: str, payload: Optional[Dict],
+               status: int, body: str, stream: bool):
+        """Store a response and append it to the file"""
+        request = dict(payload or {})
+        if 'context' in request:
+            # The key covers the context tokens; keep the file readable
+            request['context'] = f"<{len(request['context'])} tokens>"
+        entry = {
+            'key': key,
+            'method': method,
+            'path': path,
+            'request': request,
+            'status': status,
+            'stream': stream,
+            'body': body
+        }
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self.recorded += 1
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "entries": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded
+            }
+
+def _replay_body(entry: Dict, stream: bool) -> str:
+    """Recorded body in the shape the caller asked for (streamed or not)"""
+    if entry['status'] >= 400 or entry['stream'] == stream:
+        return entry['body']
+    if stream:
+        chunks = _to_chunks(json.loads(entry['body']))
+        return "".join(json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks)
+    chunks = [json.loads(line) for line in entry['body'].splitlines() if line.strip()]
+    return json.dumps(_from_chunks(chunks), ensure_ascii=False)
+
+def _requests_response(method: str, url: str, status: int, body: str) -> requests.Response:
+    """Build a requests.Response serving a recorded body"""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+    response.raw = io.BytesIO(body.encode('utf-8'))
+    response.encoding = 'utf-8'
+    response.url = url
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+class _RecordingResponse:
+    """Streamed response that copies the lines read through it into the cassette"""
+
+    def __init__(self, response: requests.Response, save):
+        self._response = response
+        self._save = save
+        self._lines = []
+        self._saved = False
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_lines(self, *args, **kwargs):
+        for line in self._response.iter_lines(*args, **kwargs):
+            self._lines.append(line.decode('utf-8') if isinstance(line, bytes) else line)
+            yield line
+        self._finish()
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if not self._saved:
+            self._saved = True
+            self._save(self._response.status_code, "".join(line + "\n" for line in self._lines if line))
+
+class CassetteClient:
+    """
+    Ollama client that records traffic to, or replays it from, a Cassette
+
+    Wraps any client with the OllamaClient interface. In record mode every
+    call goes to Ollama and its response is stored; in replay mode responses
+    come only from the cassette (a request that was never recorded raises
+    CassetteMissError); in auto mode recorded requests are replayed and the
+    rest are sent to Ollama and recorded.
+    """
+
+    def __init__(self, client, cassette: Cassette, mode: str = REPLAY):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {', '.join(MODES)}")
+        self.client = client
+        self.cassette = cassette
+        self.mode = mode
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    def url(self, path: str) -> str:
+        return self.client.url(path)
+
+    def get(self, path: str, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Send (or replay) a GET request"""
+        return self._call('GET', path, None, lambda: self.client.get(path, timeout=timeout), False)
+
+    def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """Send (or replay) a POST request (see OllamaClient.post)"""
+        return self._call('POST', path, payload,
+                          lambda: self.client.post(path, payload, timeout=timeout, stream=stream), stream)
+
+    def generate(self, payload: Dict, timeout: Union[str, float, None] = None,
+                 stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/generate endpoint"""
+        return self.post('/api/generate', payload, timeout=timeout, stream=stream)
+
+    def chat(self, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return self.post('/api/chat', payload, timeout=timeout, stream=stream)
+
+    def tags(self, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return self.get('/api/tags', timeout=timeout)
+
+    def stats(self) -> Dict:
+        stats = dict(self.client.stats())
+        stats["cassette"] = dict(self.cassette.stats(), mode=self.mode)
+        return stats
+
+    def close(self):
+        self.client.close()
+
+    def _call(self, method: str, path: str, payload: Optional[Dict], send, stream: bool):
+        key = request_key(method, path, payload)
+        if self.mode != RECORD:
+            entry = self.cassette.find(key)
+            if entry is not None:
+                return _requests_response(method, self.url(path), entry['status'], _replay_body(entry, stream))
+            if self.mode == REPLAY:
+                raise CassetteMissError(f"No recording for {method} {path} (key {key[:12]})")
+
+        response = send()
+
+        def save(status, body):
+            self.cassette.record(key, method, path, payload, status, body, stream)
+
+        if stream:
+            return _RecordingResponse(response, save)
+        save(response.status_code, response.text)
+        return response
+
+class _AsyncRecordingResponse:
+    """AsyncOllamaClient streamed response that copies the lines read through it"""
+
+    def __init__(self, response):
+        self._response = response
+        self.lines = []
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    async def aiter_lines(self):
+        async for line in self._response.aiter_lines():
+            self.lines.append(line)
+            yield line
+
+class AsyncCassetteClient:
+    """CassetteClient counterpart for the asynchronous clients, sharing its cassette"""
+
+    def __init__(self, client, cassette: Cassette, mode: str = REPLAY):
+        self.client = client
+        self.cassette = cassette
+        self.mode = mode
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    def _replayed(self, method: str, path: str, key: str, stream: bool):
+        """Return the recorded response as an httpx.Response, or None to send the request"""
+        import httpx
+        if self.mode == RECORD:
+            return None
+        entry = self.cassette.find(key)
+        if entry is None:
+            if self.mode == REPLAY:
+                raise CassetteMissError(f"No recording for {method} {path} (key {key[:12]})")
+            return None
+        url = f"{self.base_url}{path}"
+        return httpx.Response(entry['status'], content=_replay_body(entry, stream).encode('utf-8'),
+                              request=httpx.Request(method, url))
+
+    async def get(self, path: str, timeout: Union[str, float, None] = 'probe'):
+        """Send (or replay) a GET request"""
+        key = request_key('GET', path)
+        response = self._replayed('GET', path, key, False)
+        if response is None:
+            response = await self.client.get(path, timeout=timeout)
+            self.cassette.record(key, 'GET', path, None, response.status_code, response.text, False)
+        return response
+
+    async def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None):
+        """Send (or replay) a POST request"""
+        key = request_key('POST', path, payload)
+        response = self._replayed('POST', path, key, False)
+        if response is None:
+            response = await self.client.post(path, payload, timeout=timeout)
+            self.cassette.record(key, 'POST', path, payload, response.status_code, response.text, False)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, path: str, payload: Dict,
+                     timeout: Union[str, float, None] = None) -> AsyncIterator:
+        """POST (or replay) and yield the response with its body unread"""
+        key = request_key('POST', path, payload)
+        response = self._replayed('POST', path, key, True)
+        if response is not None:
+            yield response
+            return
+
+        async with self.client.stream(path, payload, timeout=timeout) as response:
+            recording = _AsyncRecordingResponse(response)
+            try:
+                yield recording
+            finally:
+                body = "".join(line + "\n" for line in recording.lines if line)
+                self.cassette.record(key, 'POST', path, payload, response.status_code, body, True)
+
+    async def generate(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/generate endpoint"""
+        return await self.post('/api/generate', payload, timeout=timeout)
+
+    async def chat(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return await self.post('/api/chat', payload, timeout=timeout)
+
+    async def tags(self, timeout: Union[str, float, None] = 'probe'):
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return await self.get('/api/tags', timeout=timeout)
+
+    def stats(self) -> Dict:
+        stats = dict(self.client.stats())
+        stats["cassette"] = dict(self.cassette.stats(), mode=self.mode)
+        return stats
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,357 @@
+import asyncio
+import os
+import threading
+import time
+import requests
+from contextlib import asynccontextmanager
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Dict, Optional, Union, Tuple
+from circuit_breaker import CircuitBreaker, backoff_delay
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+# Read timeouts (seconds) per kind of call; the connect timeout is shared
+DEFAULT_TIMEOUTS = {
+    'chat': 30,
+    'evaluation': 60,
+    'summary': 60,
+    'probe': 5,
+    'default': 30
+}
+
+# Gateway errors worth retrying; other responses are returned as they are
+RETRY_STATUSES = (502, 503, 504)
+
+class OllamaClient:
+    """
+    Thread-safe HTTP client for the Ollama API with a shared keep-alive pool
+
+    Each thread gets its own requests.Session (sessions are not safe to share
+    across threads), but all sessions mount the same HTTPAdapter, so idle
+    connections to Ollama are pooled and reused by every caller.
+
+    Calls go through a circuit breaker, and failures to connect or gateway
+    errors are retried a few times with jittered exponential backoff. Read
+    timeouts are not retried: the model may simply be slow.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, timeouts: Optional[Dict[str, float]] = None,
+                 breaker: Optional[CircuitBreaker] = None, retries: Optional[int] = None,
+                 retry_backoff: Optional[float] = None):
+        """
+        Initialize the client
+
+        Args:
+            base_url: Ollama server URL (default: OLLAMA_URL or http://localhost:11434)
+            pool_size: Maximum idle connections kept open (default: OLLAMA_POOL_SIZE or 10)
+            connect_timeout: TCP connect timeout in seconds (default: OLLAMA_CONNECT_TIMEOUT or 5)
+            timeouts: Read timeouts per call kind, merged over DEFAULT_TIMEOUTS
+            breaker: Circuit breaker for this server (default: a new one)
+            retries: Retries of transient failures (default: OLLAMA_RETRIES or 2)
+            retry_backoff: Base backoff delay in seconds (default: OLLAMA_RETRY_BACKOFF or 0.25)
+        """
+        self.base_url = (base_url or os.getenv('OLLAMA_URL', DEFAULT_OLLAMA_URL)).rstrip('/')
+        self.pool_size = pool_size or int(os.getenv('OLLAMA_POOL_SIZE', '10'))
+        self.connect_timeout = connect_timeout or float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries if retries is not None else int(os.getenv('OLLAMA_RETRIES', '2'))
+        self.retry_backoff = retry_backoff or float(os.getenv('OLLAMA_RETRY_BACKOFF', '0.25'))
+
+        # One connection pool per host, shared by every thread's session
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        """Return the calling thread's session, creating it on first use"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            session.headers['Connection'] = 'keep-alive'
+            self._local.session = session
+        return session
+
+    def _timeout(self, timeout: Union[str, float, None]) -> Tuple[float, float]:
+        """Resolve a call kind or number of seconds into a (connect, read) timeout"""
+        if timeout is None:
+            timeout = 'default'
+        if isinstance(timeout, str):
+            timeout = self.timeouts.get(timeout, self.timeouts['default'])
+        return (self.connect_timeout, timeout)
+
+    def url(self, path: str) -> str:
+        """Build the absolute URL for an API path such as /api/generate"""
+        return f"{self.base_url}{path}"
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request through the circuit breaker, retrying transient failures"""
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                response = self._session().request(method, self.url(path), **kwargs)
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                # A connect failure never reached Ollama, so it is safe to repeat
+                if attempt < self.retries and isinstance(e, requests.ConnectionError):
+                    time.sleep(backoff_delay(attempt, self.retry_backoff))
+                    continue
+                raise
+            except BaseException:
+                self.breaker.abandon()
+                raise
+
+            if response.status_code < 500:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            if attempt < self.retries and response.status_code in RETRY_STATUSES:
+                response.close()
+                time.sleep(backoff_delay(attempt, self.retry_backoff))
+                continue
+            return response
+
+    def get(self, path: str, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Send a GET request to the Ollama API"""
+        return self._request('GET', path, timeout=self._timeout(timeout))
+
+    def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """
+        Send a POST request with a JSON body to the Ollama API
+
+        Args:
+            path: API path, e.g. /api/generate
+            payload: JSON body
+            timeout: Call kind ('chat', 'evaluation', 'probe') or read timeout in seconds
+            stream: Leave the body unread so it can be consumed incrementally
+
+        Returns:
+            The HTTP response; streamed responses must be closed by the caller
+        """
+        return self._request('POST', path, json=payload, timeout=self._timeout(timeout), stream=stream)
+
+    def generate(self, payload: Dict, timeout: Union[str, float, None] = None,
+                 stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/generate endpoint"""
+        return self.post('/api/generate', payload, timeout=timeout, stream=stream)
+
+    def chat(self, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return self.post('/api/chat', payload, timeout=timeout, stream=stream)
+
+    def tags(self, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return self.get('/api/tags', timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Describe the endpoint this client talks to"""
+        return {"endpoints": [{"url": self.base_url, "breaker": self.breaker.stats()}]}
+
+    def close(self):
+        """Close all pooled connections"""
+        self._adapter.close()
+
+
+class AsyncOllamaClient:
+    """
+    Non-blocking Ollama client for the ASGI app, backed by httpx.AsyncClient
+
+    The underlying httpx client is created on first use so that importing this
+    module (e.g. from the Tk GUI) does not require httpx to be installed.
+    Failures are handled like OllamaClient: circuit breaker plus retries.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_connections: Optional[int] = None,
+                 pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 timeouts: Optional[Dict[str, float]] = None, breaker: Optional[CircuitBreaker] = None,
+                 retries: Optional[int] = None, retry_backoff: Optional[float] = None):
+        """
+        Initialize the client
+
+        Args:
+            base_url: Ollama server URL (default: OLLAMA_URL or http://localhost:11434)
+            max_connections: Concurrent connections to Ollama (default: OLLAMA_MAX_CONNECTIONS or 500)
+            pool_size: Maximum idle keep-alive connections (default: OLLAMA_POOL_SIZE or 10)
+            connect_timeout: TCP connect timeout in seconds (default: OLLAMA_CONNECT_TIMEOUT or 5)
+            timeouts: Read timeouts per call kind, merged over DEFAULT_TIMEOUTS
+            breaker: Circuit breaker for this server (default: a new one)
+            retries: Retries of transient failures (default: OLLAMA_RETRIES or 2)
+            retry_backoff: Base backoff delay in seconds (default: OLLAMA_RETRY_BACKOFF or 0.25)
+        """
+        self.base_url = (base_url or os.getenv('OLLAMA_URL', DEFAULT_OLLAMA_URL)).rstrip('/')
+        self.max_connections = max_connections or int(os.getenv('OLLAMA_MAX_CONNECTIONS', '500'))
+        self.pool_size = pool_size or int(os.getenv('OLLAMA_POOL_SIZE', '10'))
+        self.connect_timeout = connect_timeout or float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries if retries is not None else int(os.getenv('OLLAMA_RETRIES', '2'))
+        self.retry_backoff = retry_backoff or float(os.getenv('OLLAMA_RETRY_BACKOFF', '0.25'))
+        self._client = None
+
+    def _http(self):
+        """Return the httpx client, creating it inside the running event loop"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.pool_size)
+            )
+        return self._client
+
+    def _timeout(self, timeout: Union[str, float, None]):
+        """Resolve a call kind or number of seconds into an httpx timeout"""
+        import httpx
+        if timeout is None:
+            timeout = 'default'
+        if isinstance(timeout, str):
+            timeout = self.timeouts.get(timeout, self.timeouts['default'])
+        return httpx.Timeout(timeout, connect=self.connect_timeout)
+
+    async def _request(self, method: str, path: str, **kwargs):
+        """Send a request through the circuit breaker, retrying transient failures"""
+        import httpx
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                response = await self._http().request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                # A connect failure never reached Ollama, so it is safe to repeat
+                if attempt < self.retries and isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+                    continue
+                raise
+            except BaseException:
+                self.breaker.abandon()
+                raise
+
+            if response.status_code < 500:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            if attempt < self.retries and response.status_code in RETRY_STATUSES:
+                await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+                continue
+            return response
+
+    async def get(self, path: str, timeout: Union[str, float, None] = 'probe'):
+        """Send a GET request to the Ollama API"""
+        return await self._request('GET', path, timeout=self._timeout(timeout))
+
+    async def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None):
+        """Send a POST request with a JSON body to the Ollama API"""
+        return await self._request('POST', path, json=payload, timeout=self._timeout(timeout))
+
+    @asynccontextmanager
+    async def stream(self, path: str, payload: Dict,
+                     timeout: Union[str, float, None] = None) -> AsyncIterator:
+        """POST to the Ollama API and yield the response with its body unread"""
+        import httpx
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                request = self._http().build_request('POST', path, json=payload, timeout=self._timeout(timeout))
+                response = await self._http().send(request, stream=True)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt < self.retries and isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+                    continue
+                raise
+            except BaseException:
+                self.breaker.abandon()
+                raise
+
+            if response.status_code < 500:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+                if attempt < self.retries and response.status_code in RETRY_STATUSES:
+                    await response.aclose()
+                    await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+                    continue
+            try:
+                yield response
+            finally:
+                await response.aclose()
+            return
+
+    async def generate(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/generate endpoint"""
+        return await self.post('/api/generate', payload, timeout=timeout)
+
+    async def chat(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return await self.post('/api/chat', payload, timeout=timeout)
+
+    async def tags(self, timeout: Union[str, float, None] = 'probe'):
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return await self.get('/api/tags', timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Describe the endpoint this client talks to"""
+        return {"endpoints": [{"url": self.base_url, "breaker": self.breaker.stats()}]}
+
+    async def aclose(self):
+        """Close all pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_default_client = None
+_default_async_client = None
+_default_client_lock = threading.Lock()
+
+def get_client() -> OllamaClient:
+    """
+    Return the process-wide Ollama client shared by all handlers
+
+    When OLLAMA_URLS lists one or more servers this is an OllamaPool that
+    balances requests across them; otherwise a client for OLLAMA_URL. When
+    OLLAMA_CASSETTE names a file, traffic is recorded to or replayed from it
+    (see CassetteClient; OLLAMA_CASSETTE_MODE is record, replay or auto).
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                if os.getenv('OLLAMA_URLS', '').strip():
+                    from ollama_pool import OllamaPool
+                    client = OllamaPool()
+                else:
+                    client = OllamaClient()
+                cassette_path = os.getenv('OLLAMA_CASSETTE', '').strip()
+                if cassette_path:
+                    from ollama_cassette import Cassette, CassetteClient
+                    client = CassetteClient(client, Cassette(cassette_path),
+                                            os.getenv('OLLAMA_CASSETTE_MODE', 'replay').strip().lower())
+                _default_client = client
+    return _default_client
+
+def get_async_client() -> AsyncOllamaClient:
+    """Return the process-wide asynchronous Ollama client used by the ASGI app"""
+    global _default_async_client
+    if _default_async_client is None:
+        client = get_client()
+        with _default_client_lock:
+            if _default_async_client is None:
+                _default_async_client = _async_counterpart(client)
+    return _default_async_client
+
+def _async_counterpart(client):
+    """Build the asynchronous client sharing state (breaker, pool, cassette) with a sync one"""
+    if isinstance(client, OllamaClient):
+        # Share the breaker so both clients agree on the server's state
+        return AsyncOllamaClient(breaker=client.breaker)
+    from ollama_cassette import CassetteClient
+    if isinstance(client, CassetteClient):
+        from ollama_cassette import AsyncCassetteClient
+        return AsyncCassetteClient(_async_counterpart(client.client), client.cassette, client.mode)
+    from ollama_pool import AsyncOllamaPool
+    return AsyncOllamaPool(client)
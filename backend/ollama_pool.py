@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+import requests
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Union
+from ollama_client import OllamaClient, AsyncOllamaClient
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+class OllamaEndpoint:
+    """One Ollama server in a pool, with its current load and health"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        # Both clients share one breaker so they agree on the server's state
+        self.breaker = CircuitBreaker()
+        self.client = OllamaClient(self.url, breaker=self.breaker)
+        self.async_client = AsyncOllamaClient(self.url, breaker=self.breaker)
+        self.outstanding = 0
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_checked = None
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+            "breaker": self.breaker.stats()
+        }
+
+class OllamaPool:
+    """
+    Ollama client spreading requests over several servers
+
+    Has the same interface as OllamaClient. Each request goes to the healthy
+    endpoint with the fewest requests in flight (streamed responses count
+    until they are closed). A background thread probes every endpoint's
+    /api/tags; an endpoint that fails a probe, or refuses a connection, is
+    drained (it finishes what it has but gets no new requests) until a probe
+    succeeds again; so is an endpoint whose circuit breaker is open. If every
+    endpoint is down, requests are still spread over all of them (and fail
+    fast on their open breakers) rather than refused outright.
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None, health_interval: Optional[float] = None):
+        """
+        Initialize the pool
+
+        Args:
+            urls: Ollama server URLs (default: the comma-separated OLLAMA_URLS)
+            health_interval: Seconds between health probes, 0 to disable
+                (default: OLLAMA_HEALTH_INTERVAL or 10)
+        """
+        urls = urls or [url.strip() for url in os.getenv('OLLAMA_URLS', '').split(',') if url.strip()]
+        if not urls:
+            raise ValueError("OllamaPool needs at least one endpoint URL")
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.health_interval = health_interval if health_interval is not None else float(
+            os.getenv('OLLAMA_HEALTH_INTERVAL', '10'))
+        self._lock = threading.Lock()
+        self._turn = 0
+
+        if self.health_interval > 0:
+            checker = threading.Thread(target=self._health_loop, name='ollama-health', daemon=True)
+            checker.start()
+
+    @property
+    def base_url(self) -> str:
+        return self.endpoints[0].url
+
+    def acquire(self) -> OllamaEndpoint:
+        """Pick the least loaded healthy endpoint and count a request against it"""
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint.healthy and endpoint.breaker.available()] or self.endpoints
+            # Rotate the starting point so ties are shared out in turn
+            self._turn = (self._turn + 1) % len(candidates)
+            rotated = candidates[self._turn:] + candidates[:self._turn]
+            endpoint = min(rotated, key=lambda endpoint: endpoint.outstanding)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint, error: Optional[Exception] = None, unreachable: bool = False):
+        """Finish a request on an endpoint, draining it if it could not be reached"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if error is not None:
+                endpoint.errors += 1
+                endpoint.last_error = str(error)
+            if unreachable:
+                endpoint.healthy = False
+
+    def url(self, path: str) -> str:
+        """Build the absolute URL for an API path on the first endpoint"""
+        return f"{self.base_url}{path}"
+
+    def get(self, path: str, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Send a GET request to the least loaded endpoint"""
+        endpoint = self.acquire()
+        try:
+            response = endpoint.client.get(path, timeout=timeout)
+        except Exception as e:
+            self.release(endpoint, e, unreachable=isinstance(e, (requests.ConnectionError, CircuitOpenError)))
+            raise
+        self.release(endpoint)
+        return response
+
+    def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """Send a POST request to the least loaded endpoint (see OllamaClient.post)"""
+        endpoint = self.acquire()
+        try:
+            response = endpoint.client.post(path, payload, timeout=timeout, stream=stream)
+        except Exception as e:
+            self.release(endpoint, e, unreachable=isinstance(e, (requests.ConnectionError, CircuitOpenError)))
+            raise
+        if not stream:
+            self.release(endpoint)
+            return response
+
+        # A streamed response keeps the endpoint busy until the caller closes it
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self.release(endpoint)
+
+        response.close = close_and_release
+        return response
+
+    def generate(self, payload: Dict, timeout: Union[str, float, None] = None,
+                 stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/generate endpoint"""
+        return self.post('/api/generate', payload, timeout=timeout, stream=stream)
+
+    def chat(self, payload: Dict, timeout: Union[str, float, None] = None,
+             stream: bool = False) -> requests.Response:
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return self.post('/api/chat', payload, timeout=timeout, stream=stream)
+
+    def tags(self, timeout: Union[str, float, None] = 'probe') -> requests.Response:
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return self.get('/api/tags', timeout=timeout)
+
+    def check_health(self):
+        """Probe every endpoint's /api/tags and update its health"""
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.tags().raise_for_status()
+                healthy, error = True, None
+            except CircuitOpenError:
+                # Leave it to the breaker; a later probe doubles as its half-open trial
+                continue
+            except requests.RequestException as e:
+                healthy, error = False, str(e)
+            with self._lock:
+                endpoint.healthy = healthy
+                endpoint.last_checked = time.time()
+                if error:
+                    endpoint.last_error = error
+
+    def stats(self) -> Dict:
+        """Return load and health for every endpoint"""
+        with self._lock:
+            return {"endpoints": [endpoint.stats() for endpoint in self.endpoints]}
+
+    def close(self):
+        """Close all pooled connections"""
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    def _health_loop(self):
+        """Background thread: periodically probe every endpoint"""
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_health()
+            except Exception:
+                pass
+
+class AsyncOllamaPool:
+    """
+    AsyncOllamaClient counterpart of OllamaPool
+
+    Shares the endpoints, load counters and health checks of a synchronous
+    pool, so both kinds of caller see the same picture of the servers.
+    """
+
+    def __init__(self, pool: OllamaPool):
+        self.pool = pool
+
+    @property
+    def base_url(self) -> str:
+        return self.pool.base_url
+
+    def _failed(self, endpoint: OllamaEndpoint, error: Exception):
+        """Release an endpoint after a transport error"""
+        import httpx
+        self.pool.release(endpoint, error, unreachable=isinstance(error, (httpx.ConnectError, CircuitOpenError)))
+
+    async def get(self, path: str, timeout: Union[str, float, None] = 'probe'):
+        """Send a GET request to the least loaded endpoint"""
+        import httpx
+        endpoint = self.pool.acquire()
+        try:
+            response = await endpoint.async_client.get(path, timeout=timeout)
+        except (httpx.TransportError, CircuitOpenError) as e:
+            self._failed(endpoint, e)
+            raise
+        except BaseException:
+            self.pool.release(endpoint)
+            raise
+        self.pool.release(endpoint)
+        return response
+
+    async def post(self, path: str, payload: Dict, timeout: Union[str, float, None] = None):
+        """Send a POST request to the least loaded endpoint"""
+        import httpx
+        endpoint = self.pool.acquire()
+        try:
+            response = await endpoint.async_client.post(path, payload, timeout=timeout)
+        except (httpx.TransportError, CircuitOpenError) as e:
+            self._failed(endpoint, e)
+            raise
+        except BaseException:
+            self.pool.release(endpoint)
+            raise
+        self.pool.release(endpoint)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, path: str, payload: Dict,
+                     timeout: Union[str, float, None] = None) -> AsyncIterator:
+        """POST to the least loaded endpoint and yield the response with its body unread"""
+        import httpx
+        endpoint = self.pool.acquire()
+        try:
+            async with endpoint.async_client.stream(path, payload, timeout=timeout) as response:
+                yield response
+        except (httpx.TransportError, CircuitOpenError) as e:
+            self._failed(endpoint, e)
+            raise
+        except BaseException:
+            self.pool.release(endpoint)
+            raise
+        self.pool.release(endpoint)
+
+    async def generate(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/generate endpoint"""
+        return await self.post('/api/generate', payload, timeout=timeout)
+
+    async def chat(self, payload: Dict, timeout: Union[str, float, None] = None):
+        """Call Ollama's /api/chat endpoint (messages with roles)"""
+        return await self.post('/api/chat', payload, timeout=timeout)
+
+    async def tags(self, timeout: Union[str, float, None] = 'probe'):
+        """Call Ollama's /api/tags endpoint (lists installed models)"""
+        return await self.get('/api/tags', timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Return load and health for every endpoint"""
+        return self.pool.stats()
+
+    async def aclose(self):
+        """Close all pooled connections"""
+        for endpoint in self.pool.endpoints:
+            await endpoint.async_client.aclose()
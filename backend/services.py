@@ -0,0 +1,61 @@
+"""
+Objects shared by the Flask (main.py) and ASGI (asgi.py) servers
+
+Only the session store, the model handlers and static configuration live
+here; each server creates its own locks, job pool and request machinery, so
+importing this module starts no server-specific workers.
+"""
+
+import os
+import json
+from dotenv import load_dotenv
+from chat_handler import ChatHandler
+from evaluator import LanguageEvaluator
+from summarizer import ConversationSummarizer
+from session_store import SessionStore
+from session_journal import SessionJournal
+from shared_session_store import SharedSessionStore
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Session storage: a SQLite database shared by all worker processes when
+# SESSION_STORE_PATH is set, otherwise in-memory with idle expiry and LRU
+# eviction, optionally journaled to disk so conversations survive a restart
+store_path = os.getenv('SESSION_STORE_PATH')
+journal_path = os.getenv('SESSION_JOURNAL_PATH')
+if store_path:
+    sessions = SharedSessionStore(store_path)
+else:
+    sessions = SessionStore(journal=SessionJournal(journal_path) if journal_path else None)
+
+# Initialize handlers
+chat_handler = ChatHandler()
+evaluator = LanguageEvaluator()
+summarizer = ConversationSummarizer(on_update=sessions.touch)
+
+metrics.LIVE_SESSIONS.set_function(lambda: len(sessions))
+
+# Bulk evaluations: evaluations run at once across all batch requests, and
+# the most sessions one request may ask for
+EVAL_BATCH_CONCURRENCY = int(os.getenv('EVAL_BATCH_CONCURRENCY', '4'))
+EVAL_BATCH_MAX_SESSIONS = int(os.getenv('EVAL_BATCH_MAX_SESSIONS', '500'))
+
+# Languages available for learning
+LANGUAGES = [
+    {"code": "en", "name": "English"},
+    {"code": "es", "name": "Spanish"},
+    {"code": "fr", "name": "French"},
+    {"code": "de", "name": "German"},
+    {"code": "it", "name": "Italian"},
+    {"code": "pt", "name": "Portuguese"},
+    {"code": "ru", "name": "Russian"},
+    {"code": "ja", "name": "Japanese"},
+    {"code": "ko", "name": "Korean"},
+    {"code": "zh", "name": "Chinese"},
+]
+
+def sse_event(data):
+    """Format a payload as a single Server-Sent Event"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,160 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (session_id, id);
+"""
+
+class SessionJournal:
+    """
+    Append-only SQLite journal of session events for warm restarts
+
+    Every session creation, message append and clear is recorded as an event.
+    Writes are queued and committed in batches by a background thread, so the
+    chat path never waits on disk. A session that is not in memory (after a
+    restart or an eviction) is rebuilt by replaying its events on first access.
+    The database runs in WAL mode and is compacted periodically: events made
+    obsolete by a later create/clear are removed, as are sessions idle for
+    longer than the retention period.
+    """
+
+    def __init__(self, path: str, flush_interval: Optional[float] = None, batch_size: int = 256,
+                 retention: Optional[float] = None, compact_interval: float = 3600):
+        """
+        Initialize the journal
+
+        Args:
+            path: SQLite database file
+            flush_interval: Longest time an event waits before being committed
+                (default: SESSION_JOURNAL_FLUSH_INTERVAL or 0.5 seconds)
+            batch_size: Maximum events committed in one transaction
+            retention: Seconds a session's events are kept after its last activity
+                (default: SESSION_JOURNAL_RETENTION or 7 days)
+            compact_interval: Seconds between compactions
+        """
+        self.path = path
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('SESSION_JOURNAL_FLUSH_INTERVAL', '0.5'))
+        self.batch_size = batch_size
+        self.retention = retention or float(os.getenv('SESSION_JOURNAL_RETENTION', str(7 * 24 * 3600)))
+        self.compact_interval = compact_interval
+
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._unwritten = {}  # session_id -> events queued but not yet committed
+        self._written = threading.Condition()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+        self._writer = threading.Thread(target=self._run, name='session-journal', daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def record(self, session_id: str, kind: str, payload: Dict):
+        """Queue an event ('create', 'append' or 'clear') for writing"""
+        with self._written:
+            self._unwritten[session_id] = self._unwritten.get(session_id, 0) + 1
+        self._queue.put((session_id, kind, json.dumps(payload, ensure_ascii=False), time.time()))
+
+    def flush(self):
+        """Block until every queued event has been committed"""
+        self._queue.join()
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """Rebuild a session from its events, or return None if it was never journaled"""
+        # Only wait for the writer if this session still has events in flight
+        with self._written:
+            self._written.wait_for(lambda: session_id not in self._unwritten)
+        rows = self._connection().execute(
+            "SELECT kind, payload FROM events WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+
+        session = None
+        for kind, payload in rows:
+            data = json.loads(payload)
+            if kind in ('create', 'clear'):
+                session = {'language': data.get('language'), 'conversation': []}
+            elif kind == 'append':
+                if session is None:
+                    session = {'language': None, 'conversation': []}
+                session['conversation'].append(data['message'])
+        return session
+
+    def compact(self):
+        """Remove superseded events and sessions past the retention period"""
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                DELETE FROM events WHERE id < (
+                    SELECT MAX(later.id) FROM events AS later
+                    WHERE later.session_id = events.session_id AND later.kind IN ('create', 'clear')
+                )
+            """)
+            conn.execute("""
+                DELETE FROM events WHERE session_id IN (
+                    SELECT session_id FROM events GROUP BY session_id HAVING MAX(created) < ?
+                )
+            """, (time.time() - self.retention,))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the calling thread's SQLite connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _run(self):
+        """Writer thread: commit queued events in batches"""
+        conn = self._connection()
+        last_compaction = time.monotonic()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO events (session_id, kind, payload, created) VALUES (?, ?, ?, ?)", batch
+                    )
+                if time.monotonic() - last_compaction > self.compact_interval:
+                    self.compact()
+                    last_compaction = time.monotonic()
+            except sqlite3.Error:
+                # Losing a batch must never take the chat path down with it
+                pass
+            finally:
+                with self._written:
+                    for session_id, *_ in batch:
+                        remaining = self._unwritten.get(session_id, 0) - 1
+                        if remaining > 0:
+                            self._unwritten[session_id] = remaining
+                        else:
+                            self._unwritten.pop(session_id, None)
+                    self._written.notify_all()
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Hashable, Tuple
+import tracing
+
+class SessionLocks:
+    """
+    Per-session locks so requests for one conversation run one at a time
+
+    A lock is created on first use and dropped once no request holds or waits
+    for it, so the table only ever contains sessions with requests in flight.
+    Requests for different sessions never block each other. Locks are local to
+    the process; with several workers a session may still be served by two
+    workers at once.
+    """
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [lock, holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, session_id: str):
+        """Hold the session's lock for the duration of the block"""
+        with self._guard:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with tracing.span('session.wait'):
+                entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+class AsyncSessionLocks:
+    """SessionLocks for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [lock, holders and waiters]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        """Hold the session's lock for the duration of the block"""
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            with tracing.span('session.wait'):
+                await entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+class InFlightCall:
+    """The shared outcome of one in-flight request"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self) -> Any:
+        """Block until the request finishes; return its result or raise its error"""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class RequestCoalescer:
+    """
+    Collapse identical requests that arrive while the first is still running
+
+    The first caller for a key (the leader) does the work; callers arriving
+    before it finishes wait and receive the same result instead of repeating
+    it. Once the leader finishes the key is forgotten, so a later identical
+    request runs normally.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._guard = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key: Hashable) -> Tuple[InFlightCall, bool]:
+        """Return the call for a key and whether the caller is its leader"""
+        with self._guard:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = InFlightCall()
+            return call, True
+
+    def finish(self, key: Hashable, call: InFlightCall, result: Any = None, error: BaseException = None):
+        """Publish the leader's outcome to waiting callers and forget the key"""
+        call.result = result
+        call.error = error
+        with self._guard:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call._done.set()
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn, or wait for an identical in-flight call and share its result"""
+        call, leader = self.join(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result
+
+class AsyncRequestCoalescer:
+    """RequestCoalescer for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def join(self, key: Hashable) -> Tuple[asyncio.Future, bool]:
+        """Return the future for a key and whether the caller is its leader"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        return future, True
+
+    def finish(self, key: Hashable, future: asyncio.Future, result: Any = None, error: BaseException = None):
+        """Publish the leader's outcome to waiting callers and forget the key"""
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # Mark the exception retrieved in case nobody was waiting for it
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def run(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Await fn(), or an identical in-flight call, and return its result"""
+        future, leader = self.join(key)
+        if not leader:
+            return await asyncio.shield(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result
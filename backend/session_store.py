@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+from session_journal import SessionJournal
+
+# Rough per-object overheads (bytes) used when estimating a session's footprint
+SESSION_OVERHEAD_BYTES = 512
+MESSAGE_OVERHEAD_BYTES = 200
+CONTEXT_TOKEN_BYTES = 36
+
+# Session fields computed from the conversation, dropped when it is cleared
+DERIVED_KEYS = ('ollama_context', 'summary', 'summary_covers', 'history_dropped', 'last_generation')
+
+class SessionStore:
+    """
+    Bounded in-memory store for conversation sessions
+
+    Sessions expire after an idle TTL and the least recently used ones are
+    evicted once the store exceeds its maximum number of sessions or its
+    (estimated) memory budget. A background thread sweeps expired sessions.
+
+    Sessions are plain dicts shared with the caller. Code that grows a session
+    in place should call touch() afterwards so its size estimate is refreshed.
+
+    With a journal attached, conversation changes are also written to disk and
+    a session missing from memory (after a restart, eviction or expiry) is
+    restored from the journal the next time it is requested.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, max_bytes: Optional[int] = None,
+                 idle_ttl: Optional[float] = None, sweep_interval: Optional[float] = None,
+                 journal: Optional[SessionJournal] = None):
+        """
+        Initialize the store
+
+        Args:
+            max_sessions: Maximum live sessions (default: SESSION_MAX_COUNT or 10000)
+            max_bytes: Memory budget for all sessions (default: SESSION_MAX_BYTES or 256 MB)
+            idle_ttl: Seconds a session may sit unused (default: SESSION_IDLE_TTL or 7200)
+            sweep_interval: Seconds between expiry sweeps, 0 to disable the
+                background sweeper (default: SESSION_SWEEP_INTERVAL or 60)
+            journal: Optional durable journal for warm restarts
+        """
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX_COUNT', '10000'))
+        self.max_bytes = max_bytes or int(os.getenv('SESSION_MAX_BYTES', str(256 * 1024 * 1024)))
+        self.idle_ttl = idle_ttl or float(os.getenv('SESSION_IDLE_TTL', '7200'))
+        self.sweep_interval = sweep_interval if sweep_interval is not None else float(
+            os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+        self.journal = journal
+
+        self._sessions = OrderedDict()  # session_id -> session dict, least recently used first
+        self._last_used = {}
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.restored = 0
+
+        if self.sweep_interval > 0:
+            sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            sweeper.start()
+
+    def create(self, session_id: str, language: Optional[str] = None) -> Dict:
+        """Create (or reset) a session and return it"""
+        session = {
+            'language': language,
+            'conversation': []
+        }
+        with self._lock:
+            self._store(session_id, session)
+            self.created += 1
+            self._enforce_limits()
+            if self.journal is not None:
+                self.journal.record(session_id, 'create', {'language': language})
+        return session
+
+    def get_or_create(self, session_id: str, language: Optional[str] = None) -> Dict:
+        """Return a session, creating it if it does not exist; unlike create(), never resets one"""
+        with self._lock:
+            return self.get(session_id) or self.create(session_id, language)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Return a live session and mark it as recently used, or None"""
+        session = self._get_live(session_id)
+        if session is None and self.journal is not None:
+            session = self._restore(session_id)
+        return session
+
+    def append_message(self, session_id: str, message: Dict, session: Optional[Dict] = None):
+        """
+        Append a message to a session's conversation
+
+        A session evicted since the caller fetched it (other sessions filling
+        the store mid-turn) is put back first: the caller's copy if given,
+        otherwise the journal's, so neither half of a turn is lost.
+        """
+        if session is None and self.journal is not None and self._get_live(session_id) is None:
+            self._restore(session_id)
+        with self._lock:
+            live = self._sessions.get(session_id)
+            if live is None and session is not None:
+                live = session
+                self.restored += 1
+            if live is None:
+                return
+            session = live
+            session['conversation'].append(message)
+            self._store(session_id, session)
+            self._enforce_limits()
+            if self.journal is not None:
+                self.journal.record(session_id, 'append', {'message': message})
+
+    def clear_conversation(self, session_id: str) -> bool:
+        """Empty a session's conversation and drop state derived from it; return False if unknown"""
+        session = self.get(session_id)
+        if session is None:
+            return False
+        with self._lock:
+            session['conversation'] = []
+            session['evaluation_state'] = {}
+            for key in DERIVED_KEYS:
+                session.pop(key, None)
+            self._store(session_id, session)
+            if self.journal is not None:
+                self.journal.record(session_id, 'clear', {'language': session.get('language')})
+        return True
+
+    def touch(self, session_id: str):
+        """Refresh a session's size estimate and recency after it was modified"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            self._store(session_id, session)
+            self._enforce_limits()
+
+    def delete(self, session_id: str) -> bool:
+        """Remove a session; return True if it existed"""
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def sweep(self) -> int:
+        """Remove every idle-expired session; return how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid in self._sessions if self._is_expired(sid, now)]
+            for session_id in expired:
+                self._remove(session_id)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict:
+        """Return occupancy and eviction counters"""
+        with self._lock:
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                "created": self.created,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "restored": self.restored,
+                "journal": self.journal.path if self.journal is not None else None
+            }
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Dict:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def _get_live(self, session_id: str) -> Optional[Dict]:
+        """Return a session held in memory, expiring it if idle for too long"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self._is_expired(session_id, time.monotonic()):
+                self._remove(session_id)
+                self.expirations += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = time.monotonic()
+            return session
+
+    def _restore(self, session_id: str) -> Optional[Dict]:
+        """Reload a session from the journal into memory"""
+        restored = self.journal.load(session_id)
+        if restored is None:
+            return None
+        with self._lock:
+            # Another request may have restored it while we were reading
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = restored
+                self._store(session_id, session)
+                self.restored += 1
+                self._enforce_limits()
+            return session
+
+    def _store(self, session_id: str, session: Dict):
+        """Insert or refresh a session as most recently used (lock held)"""
+        size = self._measure(session)
+        self._total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+
+    def _remove(self, session_id: str):
+        """Drop a session and its bookkeeping (lock held)"""
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        self._total_bytes -= self._sizes.pop(session_id, 0)
+
+    def _enforce_limits(self):
+        """Evict least recently used sessions until within both limits (lock held)"""
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions
+                                           or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._sessions))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _is_expired(self, session_id: str, now: float) -> bool:
+        return now - self._last_used.get(session_id, now) > self.idle_ttl
+
+    def _sweep_loop(self):
+        """Background thread: periodically remove idle sessions"""
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _measure(session: Dict) -> int:
+        """Estimate the memory held by a session in bytes"""
+        size = SESSION_OVERHEAD_BYTES
+        for message in session.get('conversation', []):
+            size += MESSAGE_OVERHEAD_BYTES + len(message.get('content', '')) * 2
+        context = session.get('ollama_context')
+        if context:
+            size += CONTEXT_TOKEN_BYTES * len(context.get('tokens', []))
+        size += len(session.get('summary') or '') * 2
+        report = session.get('evaluation_state', {}).get('report')
+        if report:
+            size += len(str(report)) * 2
+        return size
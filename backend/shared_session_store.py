@@ -0,0 +1,361 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    language TEXT,
+    generation INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT '{}',
+    version INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+# Session fields stored as columns/rows rather than in the serialized state
+CORE_KEYS = ('language', 'conversation')
+
+# Each incarnation of a session gets a random generation, so a copy cached
+# from a session that expired or was deleted never matches its successor
+GENERATION_BITS = 62
+
+# Times a state write is merged and retried when other workers keep writing first
+SAVE_ATTEMPTS = 5
+
+class SharedSessionStore:
+    """
+    Session store backed by a SQLite database shared by every worker on a host
+
+    Drop-in replacement for SessionStore when the app runs as several processes
+    (e.g. gunicorn workers): any worker can serve any session. Messages are
+    stored one row each, so appends from different workers never overwrite one
+    another; everything else on the session (Ollama context, summary,
+    evaluation state) is kept as a JSON blob with a version counter, and a
+    worker writing from a stale version merges its changes field by field.
+
+    Each process keeps the session dicts it has handed out, and get() brings
+    them up to date with the database, so callers can keep mutating sessions
+    in place exactly as with SessionStore and call touch() to publish changes.
+    """
+
+    def __init__(self, path: str, max_sessions: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 sweep_interval: Optional[float] = None, cache_size: int = 1000):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite database file, on storage visible to all workers
+            max_sessions: Maximum stored sessions (default: SESSION_MAX_COUNT or 10000)
+            idle_ttl: Seconds a session may sit unused (default: SESSION_IDLE_TTL or 7200)
+            sweep_interval: Seconds between expiry sweeps, 0 to disable the
+                background sweeper (default: SESSION_SWEEP_INTERVAL or 60)
+            cache_size: Session dicts kept in this process between requests
+        """
+        self.path = path
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX_COUNT', '10000'))
+        self.idle_ttl = idle_ttl or float(os.getenv('SESSION_IDLE_TTL', '7200'))
+        self.sweep_interval = sweep_interval if sweep_interval is not None else float(
+            os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+        self.cache_size = cache_size
+
+        # session_id -> {'session', 'generation', 'version', 'state'} as last synced
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        # Counters for this process only
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+        if self.sweep_interval > 0:
+            sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            sweeper.start()
+
+    def create(self, session_id: str, language: Optional[str] = None) -> Dict:
+        """Create (or reset) a session and return it"""
+        conn = self._connection()
+        with self._lock:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute("""
+                    INSERT INTO sessions (session_id, language, generation, last_used) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        language = excluded.language, generation = excluded.generation,
+                        state = '{}', version = version + 1, last_used = excluded.last_used
+                """, (session_id, language, _new_generation(), time.time()))
+                evicted = self._evict(conn)
+            self.created += 1
+            self.evictions += evicted
+            return self._sync(session_id)
+
+    def get_or_create(self, session_id: str, language: Optional[str] = None) -> Dict:
+        """Return a session, creating it if it does not exist; unlike create(), never resets one"""
+        conn = self._connection()
+        with self._lock:
+            with conn:
+                # An expired session is replaced, as get() would not return it
+                conn.execute("DELETE FROM sessions WHERE session_id = ? AND last_used < ?",
+                             (session_id, time.time() - self.idle_ttl))
+                created = conn.execute("""
+                    INSERT OR IGNORE INTO sessions (session_id, language, generation, last_used) VALUES (?, ?, ?, ?)
+                """, (session_id, language, _new_generation(), time.time())).rowcount
+                evicted = self._evict(conn) if created else 0
+            if created:
+                # Forget a copy of an earlier session under this ID
+                self._cache.pop(session_id, None)
+            self.created += created
+            self.evictions += evicted
+            return self._sync(session_id, touch=True)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Return a live session, up to date with the database, and mark it as used"""
+        with self._lock:
+            return self._sync(session_id, touch=True)
+
+    def append_message(self, session_id: str, message: Dict, session: Optional[Dict] = None):
+        """Append a message to a session's conversation (session is accepted for SessionStore compatibility)"""
+        conn = self._connection()
+        with self._lock:
+            entry = self._cache.get(session_id)
+            try:
+                with conn:
+                    conn.execute("""
+                        INSERT INTO messages (session_id, seq, message)
+                        SELECT ?, COALESCE(MAX(seq) + 1, 0), ? FROM messages WHERE session_id = ?
+                    """, (session_id, json.dumps(message, ensure_ascii=False), session_id))
+                    if entry is not None:
+                        self._save_state(conn, session_id, entry)
+            except sqlite3.IntegrityError:
+                # The session no longer exists
+                return
+            self._sync(session_id, touch=True)
+
+    def clear_conversation(self, session_id: str) -> bool:
+        """Empty a session's conversation and drop state derived from it; return False if unknown"""
+        conn = self._connection()
+        with self._lock:
+            with conn:
+                cleared = conn.execute("""
+                    UPDATE sessions SET generation = generation + 1, state = '{}',
+                        version = version + 1, last_used = ?
+                    WHERE session_id = ?
+                """, (time.time(), session_id)).rowcount
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            if not cleared:
+                return False
+            self._sync(session_id)
+            return True
+
+    def touch(self, session_id: str):
+        """Publish in-place changes to a session to the other workers"""
+        conn = self._connection()
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                return
+            with conn:
+                self._save_state(conn, session_id, entry)
+
+    def delete(self, session_id: str) -> bool:
+        """Remove a session; return True if it existed"""
+        conn = self._connection()
+        with self._lock:
+            self._cache.pop(session_id, None)
+            with conn:
+                return conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def sweep(self) -> int:
+        """Remove every idle-expired session; return how many were removed"""
+        conn = self._connection()
+        with conn:
+            expired = conn.execute("DELETE FROM sessions WHERE last_used < ?",
+                                   (time.time() - self.idle_ttl,)).rowcount
+        with self._lock:
+            self.expirations += expired
+        return expired
+
+    def stats(self) -> Dict:
+        """Return occupancy and eviction counters"""
+        live = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        with self._lock:
+            return {
+                "live_sessions": live,
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl,
+                "cached_sessions": len(self._cache),
+                "created": self.created,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "path": self.path
+            }
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Dict:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self._connection().execute("SELECT session_id FROM sessions").fetchall()
+        return iter([row[0] for row in rows])
+
+    def _sync(self, session_id: str, touch: bool = False) -> Optional[Dict]:
+        """Bring this process's copy of a session up to date with the database (lock held)"""
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT language, generation, state, version, last_used FROM sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                self._cache.pop(session_id, None)
+                return None
+            language, generation, state, version, last_used = row
+            now = time.time()
+            if now - last_used > self.idle_ttl:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._cache.pop(session_id, None)
+                self.expirations += 1
+                return None
+            if touch:
+                conn.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+
+        entry = self._cache.get(session_id)
+        if entry is None:
+            entry = {'session': {'language': language, 'conversation': []},
+                     'generation': generation, 'version': -1, 'state': '{}'}
+            self._cache[session_id] = entry
+        session = entry['session']
+        session['language'] = language
+
+        if entry['generation'] != generation or version < entry['version']:
+            # Cleared or recreated elsewhere: start a fresh conversation list
+            session['conversation'] = []
+            entry['generation'] = generation
+            entry['version'] = -1
+
+        if version > entry['version']:
+            for key in [key for key in session if key not in CORE_KEYS]:
+                del session[key]
+            session.update(json.loads(state))
+            entry['version'] = version
+            entry['state'] = state
+
+        conversation = session['conversation']
+        rows = conn.execute(
+            "SELECT message FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+            (session_id, len(conversation))
+        ).fetchall()
+        conversation.extend(json.loads(message) for (message,) in rows)
+
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return session
+
+    def _save_state(self, conn: sqlite3.Connection, session_id: str, entry: Dict):
+        """
+        Write a session's non-conversation fields if they changed (lock and transaction held)
+
+        The write only applies on top of the version this process last synced.
+        If another worker wrote in between, the fields changed here are merged
+        into its state and the write is retried, so workers updating different
+        fields (e.g. a chat turn's Ollama context and an evaluation's state)
+        never undo each other. Changes to a session that was cleared or
+        recreated elsewhere in the meantime are dropped.
+        """
+        session = entry['session']
+        state = _dump({key: value for key, value in session.items() if key not in CORE_KEYS})
+        if state == entry['state']:
+            return
+        local = json.loads(state)
+        base = json.loads(entry['state'])
+        changed = {key: value for key, value in local.items() if key not in base or base[key] != value}
+        removed = [key for key in base if key not in local]
+
+        version = entry['version']
+        merged = local
+        for _ in range(SAVE_ATTEMPTS):
+            saved = conn.execute("""
+                UPDATE sessions SET state = ?, version = version + 1, last_used = ?
+                WHERE session_id = ? AND generation = ? AND version = ?
+            """, (state, time.time(), session_id, entry['generation'], version)).rowcount
+            if saved:
+                # Take in the fields other workers wrote; keep this process's own objects
+                for key in [key for key in session if key not in CORE_KEYS and key not in merged]:
+                    del session[key]
+                session.update((key, value) for key, value in merged.items()
+                               if key not in local or local[key] != value)
+                entry['state'] = state
+                entry['version'] = version + 1
+                return
+            row = conn.execute("SELECT generation, state, version FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            if row is None or row[0] != entry['generation']:
+                # Deleted, cleared or recreated elsewhere: the changes belong to a conversation that is gone
+                return
+            merged = json.loads(row[1])
+            merged.update(changed)
+            for key in removed:
+                merged.pop(key, None)
+            state = _dump(merged)
+            version = row[2]
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Delete the least recently used sessions beyond max_sessions (transaction held)"""
+        return conn.execute("""
+            DELETE FROM sessions WHERE session_id IN (
+                SELECT session_id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_sessions,)).rowcount
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the calling thread's SQLite connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _sweep_loop(self):
+        """Background thread: periodically remove idle sessions"""
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+def _dump(state: Dict) -> str:
+    """Serialize session state the same way every time, so unchanged state compares equal"""
+    return json.dumps(state, ensure_ascii=False, sort_keys=True)
+
+def _new_generation() -> int:
+    """Generation for a newly created session"""
+    return secrets.randbits(GENERATION_BITS)
@@ -0,0 +1,132 @@
+import os
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+from ollama_client import OllamaClient, get_client
+from chat_handler import LANGUAGE_NAMES
+from generation_budget import GenerationBudgets
+from metrics import record_ollama_result
+import tracing
+
+class ConversationSummarizer:
+    """
+    Background summariser for long conversations
+
+    When a session's history no longer fits in the chat prompt, ChatHandler
+    records how many of the oldest messages it dropped. This class compresses
+    those messages (together with any previous summary) into a short running
+    summary on a worker thread, off the request path, and stores it on the
+    session so ChatHandler can put it in the prompt in place of the dropped turns.
+    """
+
+    def __init__(self, client: Optional[OllamaClient] = None, batch_messages: Optional[int] = None,
+                 on_update: Optional[Callable[[str], None]] = None,
+                 budgets: Optional[GenerationBudgets] = None):
+        """
+        Initialize the summarizer
+
+        Args:
+            client: Ollama client (default: the shared process-wide client)
+            batch_messages: Newly dropped messages needed before summarising again
+                (default: SUMMARY_BATCH_MESSAGES or 4)
+            on_update: Called with the session id after a new summary is stored,
+                e.g. the session store's touch()
+            budgets: Generation budgets (default: from the environment)
+        """
+        self.client = client or get_client()
+        self.model = "llama3.2"  # Free Llama model
+        self.batch_messages = batch_messages or int(os.getenv('SUMMARY_BATCH_MESSAGES', '4'))
+        self.on_update = on_update
+        self.budgets = budgets or GenerationBudgets()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def maybe_schedule(self, session_id: str, session: Dict):
+        """
+        Queue a session for summarisation if enough turns fell out of the prompt
+
+        Args:
+            session_id: Session identifier (used to avoid queueing twice)
+            session: Session dict with 'conversation', 'language' and the
+                'history_dropped' count recorded by ChatHandler
+        """
+        dropped = session.get('history_dropped', 0)
+        if dropped - session.get('summary_covers', 0) < self.batch_messages:
+            return
+
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='conversation-summarizer', daemon=True)
+                self._worker.start()
+        self._queue.put((session_id, session))
+
+    def _run(self):
+        """Worker loop: summarise queued sessions one at a time"""
+        while True:
+            session_id, session = self._queue.get()
+            try:
+                if self.summarize(session) and self.on_update:
+                    self.on_update(session_id)
+            except Exception:
+                # A failed summary just leaves the previous one in place
+                pass
+            finally:
+                with self._lock:
+                    self._pending.discard(session_id)
+                self._queue.task_done()
+
+    def summarize(self, session: Dict) -> bool:
+        """Fold the dropped turns of a session into its running summary; return True if it changed"""
+        conversation = session['conversation']
+        covered = session.get('summary_covers', 0)
+        dropped = min(session.get('history_dropped', 0), len(conversation))
+        if dropped <= covered:
+            return False
+
+        prompt = self._build_prompt(session.get('summary'), conversation[covered:dropped],
+                                    session.get('language'))
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": self.budgets.for_summary()
+            }
+        }
+
+        with tracing.span('ollama.generate', kind='summary') as span:
+            response = self.client.generate(payload, timeout='summary')
+            response.raise_for_status()
+            result = response.json()
+            tracing.record_ollama_timings(span, result)
+        record_ollama_result('summary', result)
+        summary = result.get("response", "").strip()
+
+        # Discard the result if the session was cleared while we were working
+        if summary and session.get('conversation') is conversation:
+            session['summary'] = summary
+            session['summary_covers'] = dropped
+            return True
+        return False
+
+    def _build_prompt(self, previous_summary: Optional[str], messages: List[Dict], language: Optional[str]) -> str:
+        """Build the summarisation prompt"""
+        language_name = LANGUAGE_NAMES.get(language, 'English')
+        transcript = "\n".join(
+            f"{'Student' if message['role'] == 'user' else 'Tutor'}: {message['content']}"
+            for message in messages
+        )
+        earlier = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+
+        return f"""You are summarising a {language_name} practice conversation between a student and a tutor.
+
+{earlier}New part of the conversation:
+{transcript}
+
+Write an updated summary of the whole conversation in at most 120 words. Keep the topics discussed, facts the student shared about themselves and any open questions. Respond with the summary only."""
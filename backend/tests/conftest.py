@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Backend modules import one another by plain name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
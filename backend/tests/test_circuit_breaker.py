@@ -0,0 +1,102 @@
+"""CircuitBreaker state transitions, on a clock the tests move by hand"""
+
+import types
+import pytest
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, backoff_delay
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_rate=0.5, min_calls=4, window=10, reset_timeout=15)
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+def open_circuit(breaker):
+    fail(breaker, breaker.min_calls)
+    assert breaker.state == OPEN
+
+def test_stays_closed_until_enough_calls(breaker):
+    fail(breaker, 3)
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+def test_stays_closed_below_failure_rate(breaker):
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+def test_opens_at_failure_rate_and_rejects(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()["trips"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    open_circuit(breaker)
+    clock[0] += 14.9
+    assert not breaker.available()
+    clock[0] += 0.1
+    assert breaker.available()
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_successful_probe_closes(breaker, clock):
+    open_circuit(breaker)
+    clock[0] += 15
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    # The failures that opened it no longer count
+    assert breaker.stats()["recent_calls"] == 1
+    assert breaker.stats()["recent_failures"] == 0
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens_for_another_cool_down(breaker, clock):
+    open_circuit(breaker)
+    clock[0] += 15
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 2
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock[0] += 5
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+def test_abandoned_probe_frees_the_slot(breaker, clock):
+    open_circuit(breaker)
+    clock[0] += 15
+    breaker.before_call()
+    breaker.abandon()
+    assert breaker.available()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+def test_backoff_delay_is_capped():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, 0.25, cap=2.0)
+        assert 0 <= delay <= min(2.0, 0.25 * 2 ** attempt)
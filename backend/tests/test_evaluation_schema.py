@@ -0,0 +1,69 @@
+"""Repair and rejection of evaluation reports against EVALUATION_SCHEMA"""
+
+import copy
+from evaluation_schema import EVALUATION_SCHEMA, conform
+
+VALID = {
+    "mistakes": [{"message": "yo es", "correction": "yo soy", "explanation": "ser", "type": "grammar"}],
+    "strengths": ["vocabulary"],
+    "suggestions": ["practise ser and estar"],
+    "overall_score": 70,
+    "areas_for_improvement": ["verbs"],
+    "summary": "Good start"
+}
+
+def check(report):
+    problems = []
+    return conform(report, EVALUATION_SCHEMA, "report", problems), problems
+
+def test_valid_report_is_unchanged():
+    result, problems = check(copy.deepcopy(VALID))
+    assert result == VALID
+    assert problems == []
+
+def test_whole_number_float_score_becomes_an_integer():
+    report = dict(VALID, overall_score=85.0)
+    result, problems = check(report)
+    assert result["overall_score"] == 85
+    assert isinstance(result["overall_score"], int)
+    assert problems == []
+
+def test_invalid_items_and_optional_properties_are_dropped():
+    report = dict(VALID, strengths=["good", 3], mistakes=[
+        {"message": "bad"},
+        {"message": "tengo 20 anos", "correction": "tengo 20 años", "type": "spelling"},
+        {"message": "yo es", "correction": "yo soy", "explanation": 5}
+    ])
+    result, problems = check(report)
+    assert result["strengths"] == ["good"]
+    assert result["mistakes"] == [
+        {"message": "tengo 20 anos", "correction": "tengo 20 años"},
+        {"message": "yo es", "correction": "yo soy"}
+    ]
+    assert "report.strengths[1]: expected a string" in problems
+    assert "report.mistakes[0]: missing correction" in problems
+    assert "report.mistakes[1].type: 'spelling' is not one of grammar, vocabulary, pronunciation, style" in problems
+
+def test_unknown_properties_are_dropped():
+    result, _ = check(dict(VALID, confidence="high"))
+    assert "confidence" not in result
+
+def test_missing_required_property_rejects_the_report():
+    report = {key: value for key, value in VALID.items() if key != "summary"}
+    result, problems = check(report)
+    assert result is None
+    assert problems == ["report: missing summary"]
+
+def test_invalid_score_rejects_the_report():
+    for score, reason in [(101, "report.overall_score: 101 out of range"),
+                          (72.5, "report.overall_score: expected a whole number"),
+                          (True, "report.overall_score: expected a number"),
+                          ("80", "report.overall_score: expected a number")]:
+        result, problems = check(dict(VALID, overall_score=score))
+        assert result is None
+        assert problems[0] == reason
+
+def test_non_object_is_rejected():
+    result, problems = check(["not", "a", "report"])
+    assert result is None
+    assert problems == ["report: expected an object"]
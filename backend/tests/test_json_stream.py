@@ -0,0 +1,87 @@
+"""IncrementalJSONParser on output split, escaped and cut off the way model tokens arrive"""
+
+import json
+import pytest
+from json_stream import IncrementalJSONParser
+
+REPORT = {
+    "mistakes": [
+        {"message": "yo es", "correction": "yo soy"},
+        {"message": "a \"quoted\" {brace} [bracket], comma", "correction": "back\\slash"}
+    ],
+    "strengths": ["vocabulary"],
+    "overall_score": 72,
+    "summary": "Bien: \"sigue\" así}"
+}
+
+def feed_all(parser, fragments):
+    events = []
+    for fragment in fragments:
+        events.extend(parser.feed(fragment))
+    return events
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_split_output_gives_the_same_parts(size):
+    text = json.dumps(REPORT, ensure_ascii=False)
+    parser = IncrementalJSONParser()
+    events = feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+
+    assert parser.complete
+    assert parser.result() == REPORT
+    assert parser.errors == 0
+    assert events == [
+        ("mistakes", 0, REPORT["mistakes"][0]),
+        ("mistakes", 1, REPORT["mistakes"][1]),
+        ("mistakes", None, REPORT["mistakes"]),
+        ("strengths", 0, "vocabulary"),
+        ("strengths", None, ["vocabulary"]),
+        ("overall_score", None, 72),
+        ("summary", None, REPORT["summary"]),
+    ]
+
+def test_parts_are_reported_as_soon_as_they_finish():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"strengths": ["a", "b') == [("strengths", 0, "a")]
+    assert parser.feed('"], "overall_score": 5') == [("strengths", 1, "b"), ("strengths", None, ["a", "b"])]
+    assert parser.feed('0}') == [("overall_score", None, 50)]
+
+def test_text_around_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+    feed_all(parser, ['Here is the report:\n```json\n{"overall', '_score": 90}\n```', ' {"ignored": 1}'])
+    assert parser.result() == {"overall_score": 90}
+
+def test_raw_control_characters_in_strings_are_accepted():
+    parser = IncrementalJSONParser()
+    parser.feed('{"summary": "line one\nline two"}')
+    assert parser.result() == {"summary": "line one\nline two"}
+
+def test_member_that_does_not_parse_is_skipped():
+    parser = IncrementalJSONParser()
+    parser.feed('{"overall_score": 7x, "summary": "ok"}')
+    assert parser.result() == {"summary": "ok"}
+    assert parser.errors == 1
+
+def test_cut_inside_array_keeps_finished_items():
+    parser = IncrementalJSONParser()
+    parser.feed('{"summary": "ok", "strengths": ["one", "two", "thr')
+    assert not parser.complete
+    assert parser.result() == {"summary": "ok", "strengths": ["one", "two"]}
+
+def test_cut_inside_string_loses_only_that_member():
+    parser = IncrementalJSONParser()
+    parser.feed('{"overall_score": 80, "summary": "Good wo')
+    assert parser.result() == {"overall_score": 80}
+
+def test_cut_after_escaped_quote_is_still_inside_the_string():
+    parser = IncrementalJSONParser()
+    parser.feed('{"overall_score": 80, "summary": "say \\"hola\\", then')
+    assert parser.result() == {"overall_score": 80}
+
+def test_whole_pending_member_is_kept_but_a_cut_number_is_not():
+    parser = IncrementalJSONParser()
+    parser.feed('{"summary": "ok"')
+    assert parser.result() == {"summary": "ok"}
+
+    parser = IncrementalJSONParser()
+    parser.feed('{"summary": "ok", "overall_score": 8')
+    assert parser.result() == {"summary": "ok"}
@@ -0,0 +1,103 @@
+"""Per-session locks and request coalescing, threaded and async"""
+
+import asyncio
+import threading
+import time
+import pytest
+from session_locks import SessionLocks, AsyncSessionLocks, RequestCoalescer, AsyncRequestCoalescer
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+def test_coalescer_shares_the_leaders_result():
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'reply'
+
+    def request():
+        results.append(coalescer.run('key', work))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while coalescer.coalesced < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['reply'] * 4
+
+def test_coalescer_shares_the_leaders_error_then_forgets_the_key():
+    coalescer = RequestCoalescer()
+    call, leader = coalescer.join('key')
+    follower, is_leader = coalescer.join('key')
+    assert leader and not is_leader and follower is call
+
+    coalescer.finish('key', call, error=ValueError('Ollama failed'))
+    with pytest.raises(ValueError):
+        follower.wait()
+    assert coalescer.run('key', lambda: 'fresh') == 'fresh'
+
+def test_session_lock_serialises_one_session_only():
+    locks = SessionLocks()
+    active = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+    guard = threading.Lock()
+
+    def request(session_id):
+        with locks.hold(session_id):
+            with guard:
+                active[session_id] += 1
+                peak[session_id] = max(peak[session_id], active[session_id])
+            time.sleep(0.02)
+            with guard:
+                active[session_id] -= 1
+
+    run_threads([lambda: request('a')] * 4 + [lambda: request('b')] * 4)
+    assert peak == {'a': 1, 'b': 1}
+    assert len(locks) == 0
+
+def test_async_session_lock_and_coalescer():
+    async def scenario():
+        locks = AsyncSessionLocks()
+        coalescer = AsyncRequestCoalescer()
+        order = []
+        calls = []
+
+        async def turn(label):
+            async with locks.hold('s'):
+                order.append(f'{label} start')
+                await asyncio.sleep(0.01)
+                order.append(f'{label} end')
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'reply'
+
+        await asyncio.gather(turn('first'), turn('second'))
+        results = await asyncio.gather(*(coalescer.run('key', work) for _ in range(3)))
+        return order, calls, results, len(locks), coalescer.coalesced
+
+    order, calls, results, held, coalesced = asyncio.run(scenario())
+    assert order == ['first start', 'first end', 'second start', 'second end']
+    assert calls == [1]
+    assert results == ['reply'] * 3
+    assert held == 0
+    assert coalesced == 2
@@ -0,0 +1,112 @@
+"""Two SharedSessionStore instances on one database stand in for two worker processes"""
+
+import time
+import pytest
+from shared_session_store import SharedSessionStore
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    return (SharedSessionStore(path, sweep_interval=0), SharedSessionStore(path, sweep_interval=0))
+
+def contents(session):
+    return [message['content'] for message in session['conversation']]
+
+def test_messages_from_both_workers_are_kept(stores):
+    a, b = stores
+    a.create('s', 'es')
+    b.get('s')
+    a.append_message('s', {'role': 'user', 'content': 'one'})
+    b.append_message('s', {'role': 'assistant', 'content': 'two'})
+    a.append_message('s', {'role': 'user', 'content': 'three'})
+    assert contents(a.get('s')) == contents(b.get('s')) == ['one', 'two', 'three']
+
+def test_stale_worker_merges_instead_of_overwriting(stores):
+    a, b = stores
+    session_a = a.create('s', 'es')
+    session_b = b.get('s')
+    session_a['ollama_context'] = [1, 2, 3]
+    a.touch('s')
+    # b has not seen a's write when it saves its own field
+    session_b['evaluation_state'] = {'evaluated_count': 2}
+    b.touch('s')
+    session_b['summary'] = 'greetings'
+    b.append_message('s', {'role': 'user', 'content': 'hola'})
+
+    for store in (a, b):
+        session = store.get('s')
+        assert session['ollama_context'] == [1, 2, 3]
+        assert session['evaluation_state'] == {'evaluated_count': 2}
+        assert session['summary'] == 'greetings'
+
+def test_removed_field_stays_removed(stores):
+    a, b = stores
+    session_a = a.create('s', 'es')
+    session_a['summary'] = 'old'
+    a.touch('s')
+    session_b = b.get('s')
+    session_a['ollama_context'] = [4]
+    a.touch('s')
+    del session_b['summary']
+    b.touch('s')
+    assert 'summary' not in a.get('s')
+    assert a.get('s')['ollama_context'] == [4]
+
+def test_write_to_cleared_session_is_dropped(stores):
+    a, b = stores
+    session_a = a.create('s', 'es')
+    a.append_message('s', {'role': 'user', 'content': 'old'})
+    b.clear_conversation('s')
+    session_a['summary'] = 'of the old conversation'
+    a.touch('s')
+    for store in (a, b):
+        session = store.get('s')
+        assert session['conversation'] == []
+        assert 'summary' not in session
+
+def test_get_or_create_never_resets(stores):
+    a, b = stores
+    a.get_or_create('s', 'es')
+    a.append_message('s', {'role': 'user', 'content': 'hola'})
+    session = b.get_or_create('s', 'fr')
+    assert session['language'] == 'es'
+    assert contents(session) == ['hola']
+    assert b.created == 0
+
+def test_create_resets(stores):
+    a, b = stores
+    a.create('s', 'es')
+    a.append_message('s', {'role': 'user', 'content': 'hola'})
+    b.create('s', 'fr')
+    session = a.get('s')
+    assert session['language'] == 'fr'
+    assert session['conversation'] == []
+
+def test_expired_and_recreated_session_replaces_cached_copies(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    a = SharedSessionStore(path, idle_ttl=0.5, sweep_interval=0)
+    b = SharedSessionStore(path, idle_ttl=0.5, sweep_interval=0)
+    a.get_or_create('s', 'es')
+    a.append_message('s', {'role': 'user', 'content': 'old1'})
+    a.append_message('s', {'role': 'user', 'content': 'old2'})
+    session_b = b.get('s')
+    session_b['evaluation_state'] = {'report': {'overall_score': 10}}
+    b.touch('s')
+
+    time.sleep(0.7)
+    a.get_or_create('s', 'es')
+    a.append_message('s', {'role': 'user', 'content': 'new1'})
+    # b's stale copy must not leak into the new session
+    b.touch('s')
+
+    for store in (a, b):
+        session = store.get('s')
+        assert contents(session) == ['new1']
+        assert 'evaluation_state' not in session
+
+def test_unknown_session(stores):
+    a, _ = stores
+    assert a.get('missing') is None
+    assert not a.clear_conversation('missing')
+    a.append_message('missing', {'role': 'user', 'content': 'lost'})
+    assert 'missing' not in a
@@ -0,0 +1,304 @@
+"""
+Lightweight request tracing for the Language Teacher backend
+
+A trace is a tree of timed spans: one per HTTP request, with children for the
+work done on its behalf (waiting for the session lock, building the prompt,
+the Ollama call, parsing the evaluation JSON). The current span is kept in a
+context variable, so nesting follows threads and asyncio tasks without being
+passed around.
+
+Finished spans are exported in the background, set by TRACE_EXPORT:
+  - unset or empty: tracing is off and spans cost next to nothing
+  - "otlp": OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT
+    (default http://localhost:4318/v1/traces, e.g. a local OpenTelemetry Collector)
+  - anything else: path of a file that gets one JSON object per span
+"""
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class _RemoteParent:
+    """Parent span from another service, taken from a W3C traceparent header"""
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off"""
+    trace_id = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class JsonLinesExporter:
+    """Append finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+class OTLPExporter:
+    """Send finished spans to an OTLP/HTTP collector using the JSON encoding"""
+
+    def __init__(self, endpoint: Optional[str] = None, service_name: Optional[str] = None):
+        self.endpoint = endpoint or os.getenv('TRACE_OTLP_ENDPOINT', DEFAULT_OTLP_ENDPOINT)
+        self.service_name = service_name or os.getenv('TRACE_SERVICE_NAME', 'language-teacher')
+
+    def export(self, spans: List[Span]):
+        import requests
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "language-teacher"},
+                    "spans": [self._encode(span) for span in spans]
+                }]
+            }]
+        }
+        requests.post(self.endpoint, json=body, timeout=5).raise_for_status()
+
+    def _encode(self, span: Span) -> Dict:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if "http.method" in span.attributes else 1,  # SERVER for requests, else INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to an exporter
+
+    Export runs on a background thread in batches, so a slow collector never
+    delays a request; if the backlog grows past max_queued, spans are dropped
+    and counted instead.
+    """
+
+    def __init__(self, exporter=None, batch_size: int = 256, flush_interval: float = 1.0,
+                 max_queued: int = 10000):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+        if exporter is not None:
+            worker = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            worker.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """
+        Start a span as a child of the current one and make it current
+
+        For callers that cannot use the span() context manager (e.g. a span
+        that ends when a streamed response is closed). Pass the returned token
+        to end_span().
+
+        Args:
+            name: Span name
+            traceparent: W3C traceparent header to continue a caller's trace
+            attributes: Initial span attributes
+
+        Returns:
+            (span, token)
+        """
+        if self.exporter is None:
+            return NOOP_SPAN, None
+        parent = _parse_traceparent(traceparent) or _current.get()
+        span = Span(name, parent.trace_id if parent else secrets.token_hex(16),
+                    parent.span_id if parent else None, attributes)
+        return span, (_current.get(), _current.set(span))
+
+    def end_span(self, span, token, error: Optional[BaseException] = None):
+        """Finish a span started with start_span() and restore the previous current span"""
+        if token is None:
+            return
+        previous, context_token = token
+        try:
+            _current.reset(context_token)
+        except ValueError:
+            # Ended from another context (e.g. a generator finished elsewhere)
+            _current.set(previous)
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator:
+        """Run the block inside a child span of the current one"""
+        span, token = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            # GeneratorExit means the consumer stopped early, not a failure
+            self.end_span(span, token, None if isinstance(e, GeneratorExit) else e)
+            raise
+        self.end_span(span, token)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "export_errors": self.export_errors,
+            "queued": self._queue.qsize()
+        }
+
+    def _run(self):
+        """Background thread: export finished spans in batches"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(batch)
+                self.exported += len(batch)
+            except Exception:
+                self.export_errors += 1
+                self.dropped += len(batch)
+
+def _parse_traceparent(header: Optional[str]) -> Optional[_RemoteParent]:
+    """Read the trace and parent span ids from a W3C traceparent header"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return _RemoteParent(parts[1], parts[2])
+
+def _tracer_from_env() -> Tracer:
+    target = os.getenv('TRACE_EXPORT', '').strip()
+    if not target:
+        return Tracer()
+    if target.lower() == 'otlp':
+        return Tracer(OTLPExporter())
+    return Tracer(JsonLinesExporter(target))
+
+TRACER = _tracer_from_env()
+
+def span(name: str, **attributes):
+    """Context manager running the block inside a child span of the current one"""
+    return TRACER.span(name, **attributes)
+
+def start_span(name: str, traceparent: Optional[str] = None, **attributes) -> Tuple:
+    """See Tracer.start_span"""
+    return TRACER.start_span(name, traceparent, **attributes)
+
+def end_span(span, token, error: Optional[BaseException] = None):
+    """See Tracer.end_span"""
+    TRACER.end_span(span, token, error)
+
+def current_span():
+    """Return the span the caller is running in, or a no-op span"""
+    return _current.get() or NOOP_SPAN
+
+def traced(name: str) -> Callable:
+    """Decorator running each call of a function inside a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record_ollama_timings(span, result: Dict):
+    """Attach the timings and token counts Ollama reports to a span, in milliseconds"""
+    for field in ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration'):
+        if field in result:
+            span.set_attribute(f"ollama.{field}_ms", round(result[field] / 1e6, 3))
+    for field in ('prompt_eval_count', 'eval_count'):
+        if field in result:
+            span.set_attribute(f"ollama.{field}", result[field])
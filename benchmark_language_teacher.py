@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Language Teacher Benchmark
+Load-tests the backend against a built-in stub Ollama server, so changes to
+the Python layer can be measured without a model or GPU.
+
+The stub answers /api/chat and /api/generate (streamed or not) and /api/tags with a
+configurable delay before the first token and generation speed. The
+benchmark starts the backend on it (Flask or ASGI), then simulated learners
+each open a session, send a few chat messages and request an evaluation.
+Throughput and p50/p95/p99 latency are reported per endpoint.
+
+Examples:
+    python benchmark_language_teacher.py
+    python benchmark_language_teacher.py --server asgi --concurrency 64 --sessions 500 --stream
+    python benchmark_language_teacher.py --stub-only --stub-port 11434
+    python benchmark_language_teacher.py --server none --target http://localhost:5000
+"""
+
+import argparse
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add backend directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+STUB_CHAT_REPLY = "¡Qué bien! Me alegra saber de ti. ¿Qué te gusta hacer los fines de semana?"
+
+STUB_EVALUATION = {
+    "overall_score": 82,
+    "mistakes": [{
+        "message": "yo es estudiante",
+        "correction": "yo soy estudiante",
+        "explanation": "Use 'soy' (ser, first person) with 'yo'",
+        "type": "grammar"
+    }],
+    "suggestions": ["Review the conjugation of ser and estar"],
+    "summary": "Good communication with a few verb agreement errors.",
+    "strengths": ["Clear and polite messages"],
+    "areas_for_improvement": ["Verb conjugation"]
+}
+
+LEARNER_MESSAGES = [
+    "Hola, me llamo {name} y yo es estudiante.",
+    "Me gusta mucho leer libros y jugar al fútbol con mis amigos.",
+    "Ayer fui al mercado y compré muchas frutas para mi familia.",
+    "¿Qué me recomiendas para practicar la pronunciación?",
+    "Mañana voy a visitar a mi abuela que vive en el campo."
+]
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Mimics the parts of the Ollama API the backend uses"""
+    protocol_version = "HTTP/1.1"
+
+    # Set by start_stub_ollama()
+    latency = 0.05
+    tokens_per_second = 50.0
+    chat_tokens = 20
+    evaluation_tokens = 200
+    chars_per_token = 4
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({"models": [{"name": "llama3.2:latest"}]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path not in ('/api/chat', '/api/generate'):
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        chat = self.path == '/api/chat'
+        if chat:
+            prompt = "\n\n".join(message.get("content", "") for message in body.get("messages", []))
+        else:
+            prompt = body.get("prompt", "")
+        if "evaluating a student" in prompt:
+            text, token_count = json.dumps(STUB_EVALUATION, ensure_ascii=False), self.evaluation_tokens
+        else:
+            text, token_count = STUB_CHAT_REPLY, self.chat_tokens
+        tokens = self._split(text, token_count)
+        prompt_tokens = len(prompt) // self.chars_per_token
+        stats = {
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": token_count,
+            "load_duration": 0,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_duration": int(token_count / self.tokens_per_second * 1e9),
+            "total_duration": int((self.latency + token_count / self.tokens_per_second) * 1e9),
+            "done_reason": "stop"
+        }
+        if not chat:
+            stats["context"] = list(body.get("context") or []) + [0] * (prompt_tokens + token_count)
+
+        def reply(content):
+            if chat:
+                return {"model": body.get("model"), "message": {"role": "assistant", "content": content}}
+            return {"model": body.get("model"), "response": content}
+
+        time.sleep(self.latency)
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(1 / self.tokens_per_second)
+                self._send_chunk(dict(reply(token), done=False))
+            self._send_chunk(dict(stats, **reply(""), done=True))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        else:
+            time.sleep(token_count / self.tokens_per_second)
+            self._send_json(dict(stats, **reply(text), done=True))
+
+    def _split(self, text: str, token_count: int):
+        """Cut text into token_count pieces (the last may be empty padding)"""
+        size = max(1, -(-len(text) // max(1, token_count)))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        return pieces + [""] * (token_count - len(pieces))
+
+    def _send_chunk(self, data):
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode('utf-8')
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _send_json(self, data, status=200):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_stub_ollama(port=0, latency=0.05, tokens_per_second=50.0, chat_tokens=20, evaluation_tokens=200):
+    """Start the stub Ollama server in a background thread and return it"""
+    handler = type('ConfiguredStubOllamaHandler', (StubOllamaHandler,), {
+        'latency': latency,
+        'tokens_per_second': tokens_per_second,
+        'chat_tokens': chat_tokens,
+        'evaluation_tokens': evaluation_tokens
+    })
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-ollama', daemon=True).start()
+    return server
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_backend(kind, ollama_url):
+    """Start the Flask or ASGI backend in this process, talking to ollama_url; return its URL"""
+    os.environ['OLLAMA_URL'] = ollama_url
+    os.environ.pop('OLLAMA_URLS', None)
+
+    port = free_port()
+    if kind == 'flask':
+        import logging
+        from werkzeug.serving import make_server
+        from main import app
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no per-request access log
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='backend', daemon=True).start()
+    else:
+        import uvicorn
+        from asgi import app
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+        threading.Thread(target=server.run, name='backend', daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+class Recorder:
+    """Collects per-endpoint latencies and error counts from all learners"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(seconds)
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+def run_learner(base_url, index, turns, stream, recorder):
+    """One simulated learner: create a session, chat for a few turns, then ask for an evaluation"""
+    import requests
+    http = requests.Session()
+    session_id = f"bench-{index}-{time.time_ns()}"
+
+    def timed(endpoint, send):
+        started = time.perf_counter()
+        try:
+            response = send()
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        recorder.record(endpoint, time.perf_counter() - started, ok)
+        return ok
+
+    timed('/api/session/new', lambda: http.post(f"{base_url}/api/session/new",
+                                                 json={"session_id": session_id, "language": "es"}))
+    for turn in range(turns):
+        message = LEARNER_MESSAGES[turn % len(LEARNER_MESSAGES)].format(name=f"Ana {index}")
+        body = {"session_id": session_id, "message": message, "language": "es"}
+        if stream:
+            def send_stream():
+                started = time.perf_counter()
+                with http.post(f"{base_url}/api/chat/stream", json=body, stream=True) as response:
+                    first = True
+                    for line in response.iter_lines():
+                        if first and line.startswith(b'data:'):
+                            recorder.record('/api/chat/stream (first token)', time.perf_counter() - started, True)
+                            first = False
+                    return response
+            timed('/api/chat/stream', send_stream)
+        else:
+            timed('/api/chat', lambda: http.post(f"{base_url}/api/chat", json=body))
+    timed('/api/evaluate', lambda: http.post(f"{base_url}/api/evaluate", json={"session_id": session_id}))
+
+def run_benchmark(base_url, sessions, concurrency, turns, stream):
+    """Run all learners and return the report"""
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(run_learner, base_url, index, turns, stream, recorder)
+                       for index in range(sessions)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(endpoint, []))
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput_per_second": round(len(values) / elapsed, 2),
+            "mean_ms": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+            "p50_ms": round(1000 * percentile(values, 0.50), 2),
+            "p95_ms": round(1000 * percentile(values, 0.95), 2),
+            "p99_ms": round(1000 * percentile(values, 0.99), 2)
+        }
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "turns": turns,
+        "stream": stream,
+        "elapsed_seconds": round(elapsed, 3),
+        "endpoints": endpoints
+    }
+
+def print_report(report):
+    print(f"\n📊 {report['sessions']} sessions x {report['turns']} turns, "
+          f"concurrency {report['concurrency']}, {report['elapsed_seconds']}s")
+    print("=" * 96)
+    print(f"{'endpoint':34} {'requests':>8} {'errors':>6} {'req/s':>8} "
+          f"{'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:34} {row['requests']:>8} {row['errors']:>6} {row['throughput_per_second']:>8} "
+              f"{row['mean_ms']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Language Teacher backend against a stub Ollama")
+    parser.add_argument('--server', choices=['flask', 'asgi', 'none'], default='flask',
+                        help="Backend to start in-process ('none' to benchmark --target)")
+    parser.add_argument('--target', help="URL of an already running backend (with --server none)")
+    parser.add_argument('--sessions', type=int, default=100, help="Simulated learners in total")
+    parser.add_argument('--concurrency', type=int, default=16, help="Learners active at once")
+    parser.add_argument('--turns', type=int, default=3, help="Chat messages per learner before the evaluation")
+    parser.add_argument('--stream', action='store_true', help="Use /api/chat/stream instead of /api/chat")
+    parser.add_argument('--stub-port', type=int, default=0, help="Port for the stub Ollama (default: any free port)")
+    parser.add_argument('--stub-latency', type=float, default=0.05,
+                        help="Seconds before the stub's first token (model load + prompt eval)")
+    parser.add_argument('--stub-tokens-per-sec', type=float, default=50.0, help="Stub generation speed")
+    parser.add_argument('--stub-chat-tokens', type=int, default=20, help="Tokens in each stub chat reply")
+    parser.add_argument('--stub-evaluation-tokens', type=int, default=200, help="Tokens in each stub evaluation")
+    parser.add_argument('--stub-only', action='store_true',
+                        help="Only run the stub Ollama (e.g. for a backend started separately)")
+    parser.add_argument('--json', metavar='PATH', help="Also write the report as JSON to PATH")
+    args = parser.parse_args()
+
+    stub = start_stub_ollama(args.stub_port, args.stub_latency, args.stub_tokens_per_sec,
+                             args.stub_chat_tokens, args.stub_evaluation_tokens)
+    ollama_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    print(f"🤖 Stub Ollama listening on {ollama_url}")
+
+    if args.stub_only:
+        print("Press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return 0
+
+    if args.server == 'none':
+        if not args.target:
+            parser.error("--server none needs --target")
+        base_url = args.target.rstrip('/')
+    else:
+        base_url = start_backend(args.server, ollama_url)
+    print(f"🚀 Benchmarking {base_url}")
+
+    report = run_benchmark(base_url, args.sessions, args.concurrency, args.turns, args.stream)
+    report["server"] = args.server
+    report["stub"] = {
+        "latency": args.stub_latency,
+        "tokens_per_second": args.stub_tokens_per_sec,
+        "chat_tokens": args.stub_chat_tokens,
+        "evaluation_tokens": args.stub_evaluation_tokens
+    }
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+
+    failed = sum(row["errors"] for row in report["endpoints"].values())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -147,11 +147,11 @@ class LanguageTeacher {
         this.addMessageToChat(message, 'user');
         this.messageInput.value = '';
 
-        // Show loading
+        // Show loading until the first token arrives
         this.showLoading('Sending message...');
 
         try {
-            const response = await fetch(`${this.apiBase}/chat`, {
+            const response = await fetch(`${this.apiBase}/chat/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -163,14 +163,34 @@ class LanguageTeacher {
                 })
             });
 
-            const data = await response.json();
-            
-            if (data.error) {
-                throw new Error(data.error);
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error || `HTTP ${response.status}`);
             }
 
-            // Add AI response to chat
-            this.addMessageToChat(data.response, 'assistant');
+            // Render the AI response as tokens stream in
+            let contentDiv = null;
+            await this.readEventStream(response, (event) => {
+                if (event.token) {
+                    if (!contentDiv) {
+                        this.hideLoading();
+                        contentDiv = this.addMessageToChat('', 'assistant');
+                    }
+                    contentDiv.textContent += event.token;
+                    this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+                } else if (event.done) {
+                    // A shared, cached or fallback reply (or one cut to nothing) arrives without tokens
+                    const text = event.error
+                        ? 'Sorry, I encountered an error. Please try again.'
+                        : event.response;
+                    if (!contentDiv) {
+                        this.hideLoading();
+                        contentDiv = this.addMessageToChat(text || '', 'assistant');
+                    } else {
+                        contentDiv.textContent = text;
+                    }
+                }
+            });
             
         } catch (error) {
             console.error('Error sending message:', error);
@@ -180,6 +200,32 @@ class LanguageTeacher {
         }
     }
 
+    async readEventStream(response, onEvent) {
+        // Parse a text/event-stream body and hand each event's data to onEvent
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLines = rawEvent
+                    .split('\n')
+                    .filter(line => line.startsWith('data: '))
+                    .map(line => line.slice(6));
+                if (dataLines.length > 0) {
+                    onEvent(JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
     addMessageToChat(content, sender) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}`;
@@ -195,6 +241,7 @@ class LanguageTeacher {
         
         this.chatMessages.appendChild(messageDiv);
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        return contentDiv;
     }
 
     async requestEvaluation() {
@@ -206,7 +253,8 @@ class LanguageTeacher {
         this.showLoading('Analyzing your conversation...');
 
         try {
-            const response = await fetch(`${this.apiBase}/evaluate`, {
+            // Show each part of the report as soon as the model has written it
+            const response = await fetch(`${this.apiBase}/evaluate/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -216,10 +264,32 @@ class LanguageTeacher {
                 })
             });
 
-            const evaluation = await response.json();
-            
-            if (evaluation.error) {
-                throw new Error(evaluation.error);
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+
+            const partial = {};
+            let evaluation = null;
+            await this.readEventStream(response, (event) => {
+                if (event.done) {
+                    if (event.error) {
+                        throw new Error(event.error);
+                    }
+                    evaluation = event.evaluation;
+                    return;
+                }
+                if ('item' in event) {
+                    partial[event.field] = (partial[event.field] || []).concat([event.item]);
+                } else {
+                    partial[event.field] = event.value;
+                }
+                this.hideLoading();
+                this.displayEvaluation(partial, false);
+            });
+
+            if (!evaluation) {
+                throw new Error('Evaluation did not finish');
             }
 
             this.displayEvaluation(evaluation);
@@ -232,12 +302,17 @@ class LanguageTeacher {
         }
     }
 
-    displayEvaluation(evaluation) {
+    displayEvaluation(evaluation, complete = true) {
+        // While the report is still streaming in, fields not received yet show as pending
+        const pending = !complete;
+
         // Update score
-        document.getElementById('overall-score').textContent = evaluation.overall_score || 0;
+        document.getElementById('overall-score').textContent =
+            evaluation.overall_score ?? (pending ? '--' : 0);
         
         // Update summary
-        document.getElementById('evaluation-summary').textContent = evaluation.summary || 'No summary available.';
+        document.getElementById('evaluation-summary').textContent =
+            evaluation.summary || (pending ? 'Analyzing your conversation...' : 'No summary available.');
         
         // Update strengths
         const strengthsList = document.getElementById('strengths-list');
@@ -248,7 +323,7 @@ class LanguageTeacher {
                 li.textContent = strength;
                 strengthsList.appendChild(li);
             });
-        } else {
+        } else if (!pending || 'strengths' in evaluation) {
             const li = document.createElement('li');
             li.textContent = 'No specific strengths identified.';
             li.style.fontStyle = 'italic';
@@ -272,7 +347,7 @@ class LanguageTeacher {
                 
                 mistakesList.appendChild(mistakeDiv);
             });
-        } else {
+        } else if (!pending || 'mistakes' in evaluation) {
             const div = document.createElement('div');
             div.textContent = 'No mistakes found! Great job!';
             div.style.textAlign = 'center';
@@ -291,7 +366,7 @@ class LanguageTeacher {
                 li.textContent = suggestion;
                 suggestionsList.appendChild(li);
             });
-        } else {
+        } else if (!pending || 'suggestions' in evaluation) {
             const li = document.createElement('li');
             li.textContent = 'Keep practicing!';
             li.style.fontStyle = 'italic';
@@ -308,7 +383,7 @@ class LanguageTeacher {
                 li.textContent = area;
                 improvementList.appendChild(li);
             });
-        } else {
+        } else if (!pending || 'areas_for_improvement' in evaluation) {
             const li = document.createElement('li');
             li.textContent = 'Continue practicing to maintain your skills!';
             li.style.fontStyle = 'italic';
@@ -10,7 +10,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 try:
     from chat_handler import ChatHandler
-    from evaluator import LanguageEvaluator
+    from evaluator import LanguageEvaluator, add_evaluation_part
     print("SUCCESS: Backend modules imported")
 except Exception as e:
     print(f"ERROR: Cannot import backend modules: {e}")
@@ -38,6 +38,8 @@ class LanguageTeacherGUI:
         self.current_session = None
         self.selected_language = None
         self.conversation_history = []
+        self.evaluation_state = {}
+        self.chat_state = {}
         
         # Available languages
         self.languages = [
@@ -223,6 +225,8 @@ class LanguageTeacherGUI:
             
         self.current_session = str(uuid.uuid4())
         self.conversation_history = []
+        self.evaluation_state = {}
+        self.chat_state = {}
         
         # Clear chat
         self.chat_text.config(state=tk.NORMAL)
@@ -275,7 +279,8 @@ class LanguageTeacherGUI:
             ai_response = self.chat_handler.get_response(
                 self.conversation_history[-1]["content"],
                 self.selected_language["code"],
-                self.conversation_history
+                self.conversation_history,
+                self.chat_state
             )
             
             print(f"AI response: {ai_response[:100]}...")
@@ -342,10 +347,18 @@ class LanguageTeacherGUI:
         """Run evaluation (runs in separate thread)"""
         try:
             print("Running evaluation...")
-            evaluation = self.evaluator.evaluate_conversation(
+            # Show each part of the report as soon as the model has written it
+            evaluation = {}
+            for part in self.evaluator.stream_evaluation(
                 self.conversation_history,
-                self.selected_language["code"]
-            )
+                self.selected_language["code"],
+                self.evaluation_state
+            ):
+                if part.get("done"):
+                    evaluation = part["evaluation"]
+                    break
+                evaluation = add_evaluation_part(evaluation, part)
+                self.root.after(0, lambda partial=evaluation: self.display_evaluation(partial, complete=False))
             
             print("Evaluation completed")
             
@@ -358,18 +371,18 @@ class LanguageTeacherGUI:
             self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
             self.root.after(0, lambda: self.evaluate_btn.config(state=tk.NORMAL))
             
-    def display_evaluation(self, evaluation):
-        """Display evaluation results"""
+    def display_evaluation(self, evaluation, complete=True):
+        """Display evaluation results (or, while complete is False, the parts received so far)"""
         self.eval_text.config(state=tk.NORMAL)
         self.eval_text.delete(1.0, tk.END)
         
         # Overall score
-        score = evaluation.get("overall_score", 0)
+        score = evaluation.get("overall_score", 0 if complete else "--")
         self.eval_text.insert(tk.END, f"Overall Score: {score}/100\n", "score")
         self.eval_text.insert(tk.END, "\n")
         
         # Summary
-        summary = evaluation.get("summary", "No summary available.")
+        summary = evaluation.get("summary", "No summary available." if complete else "...")
         self.eval_text.insert(tk.END, "Summary:\n", "heading")
         self.eval_text.insert(tk.END, f"{summary}\n\n")
         
@@ -392,7 +405,7 @@ class LanguageTeacherGUI:
                 self.eval_text.insert(tk.END, f'"{mistake.get("correction", "")}"', "correction")
                 self.eval_text.insert(tk.END, f"\n  {mistake.get('explanation', '')}\n")
             self.eval_text.insert(tk.END, "\n")
-        else:
+        elif complete or "mistakes" in evaluation:
             self.eval_text.insert(tk.END, "No mistakes found! Great job!\n\n")
         
         # Suggestions
@@ -411,6 +424,8 @@ class LanguageTeacherGUI:
                 self.eval_text.insert(tk.END, f"• {area}\n")
         
         self.eval_text.config(state=tk.DISABLED)
+        if not complete:
+            return
         self.evaluate_btn.config(state=tk.NORMAL)
         self.status_label.config(text=f"Evaluation complete! Score: {score}/100")
         self.debug_label.config(text="Debug: Evaluation completed")
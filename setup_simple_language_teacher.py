@@ -6,15 +6,24 @@ Handles Ollama model download, service startup, and verification
 
 import subprocess
 import time
-import requests
 import sys
 import os
 import json
 from pathlib import Path
 
+# Add backend directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from ollama_client import OllamaClient
+from circuit_breaker import CircuitBreaker
+
 class LanguageTeacherSetup:
     def __init__(self):
         self.ollama_url = "http://localhost:11434"
+        # Polls a server that may still be starting: every probe must really
+        # reach it, so no retries and a breaker that never opens
+        self.client = OllamaClient(self.ollama_url, retries=0,
+                                   breaker=CircuitBreaker(failure_rate=float('inf')))
         self.model_name = "llama3.2"
         self.setup_log = []
         
@@ -55,11 +64,11 @@ class LanguageTeacherSetup:
         
         try:
             # Check if service is already running
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
+            response = self.client.tags(timeout=5)
             if response.status_code == 200:
                 self.log("SUCCESS: Ollama service is already running")
                 return True
-        except:
+        except Exception:
             pass
         
         try:
@@ -74,11 +83,11 @@ class LanguageTeacherSetup:
             # Check if service is now running
             for attempt in range(10):
                 try:
-                    response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
+                    response = self.client.tags(timeout=5)
                     if response.status_code == 200:
                         self.log("SUCCESS: Ollama service started successfully")
                         return True
-                except:
+                except Exception:
                     time.sleep(2)
                     
             self.log("ERROR: Failed to start Ollama service", "ERROR")
@@ -93,7 +102,7 @@ class LanguageTeacherSetup:
         self.log(f"Checking if {self.model_name} model is installed...")
         
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=10)
+            response = self.client.tags(timeout=10)
             if response.status_code == 200:
                 models = response.json().get("models", [])
                 for model in models:
@@ -164,9 +173,7 @@ class LanguageTeacherSetup:
                 }
             }
             
-            response = requests.post(f"{self.ollama_url}/api/generate",
-                                   json=test_payload,
-                                   timeout=30)
+            response = self.client.generate(test_payload, timeout=30)
             
             if response.status_code == 200:
                 result = response.json()
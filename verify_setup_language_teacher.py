@@ -4,17 +4,21 @@ Language Teacher Verification Script
 Tests all components after setup
 """
 
-import requests
 import subprocess
 import sys
 import os
 import json
 
+# Add backend directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from ollama_client import get_client
+
 def test_ollama_service():
     """Test if Ollama service is running"""
     print("🔗 Testing Ollama service...")
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = get_client().tags(timeout=5)
         if response.status_code == 200:
             print("✅ Ollama service is running")
             return True
@@ -29,7 +33,7 @@ def test_model():
     """Test if llama3.2 model is available"""
     print("🤖 Testing llama3.2 model...")
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = get_client().tags(timeout=5)
         if response.status_code == 200:
             models = response.json().get("models", [])
             for model in models:
@@ -63,8 +67,7 @@ def test_model_response():
             }
         }
         
-        response = requests.post("http://localhost:11434/api/generate",
-                               json=payload, timeout=30)
+        response = get_client().generate(payload, timeout=30)
         
         if response.status_code == 200:
             result = response.json()
@@ -108,9 +111,6 @@ def test_gui_imports():
     print("🖥️ Testing GUI imports...")
     
     try:
-        # Add backend to path
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
-        
         from chat_handler import ChatHandler
         print("✅ chat_handler")
         